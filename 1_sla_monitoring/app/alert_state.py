@@ -0,0 +1,80 @@
+import os
+from collections import OrderedDict
+from sqlalchemy import text, bindparam, String, DateTime
+from sqlalchemy.dialects.postgresql import ARRAY
+
+# alert lifecycle of a (ticket, sla) pair; states only ever move forward
+STATES = ("none", "warned", "breached")
+RANK = {s: i for i, s in enumerate(STATES)}
+
+ALERT_STATE_CACHE_SIZE = int(os.getenv("ALERT_STATE_CACHE_SIZE", "1000000"))
+
+def _rank_sql(col):
+    return "CASE {} {} ELSE 0 END".format(
+        col, " ".join(f"WHEN '{s}' THEN {r}" for s, r in RANK.items() if r)
+    )
+
+# Moves each (ticket_id, sla) forward to the given state; returns the pairs it moved
+ADVANCE = text(f"""
+    INSERT INTO alert_states (ticket_id, sla, state, updated_at)
+    SELECT i.ticket_id, i.sla, i.state, :now
+    FROM unnest(:ticket_ids, :slas, :states) AS i(ticket_id, sla, state)
+    ON CONFLICT (ticket_id, sla) DO UPDATE
+        SET state = excluded.state, updated_at = excluded.updated_at
+        WHERE {_rank_sql("alert_states.state")} < {_rank_sql("excluded.state")}
+    RETURNING ticket_id, sla
+""").bindparams(
+    bindparam("ticket_ids", type_=ARRAY(String)),
+    bindparam("slas", type_=ARRAY(String)),
+    bindparam("states", type_=ARRAY(String)),
+    bindparam("now", type_=DateTime),
+)
+
+class AlertStateCache:
+    """
+    Bounded LRU view of `alert_states`. A transition is emitted only if it moves the
+    pair forward both here and in the table, where the (ticket_id, sla) primary key
+    arbitrates between processes racing on the same pair. An evicted pair costs one
+    extra upsert the next time it is due, never a duplicate alert.
+    """
+    def __init__(self, maxsize=ALERT_STATE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._states = OrderedDict()
+
+    def __len__(self):
+        return len(self._states)
+
+    async def advance(self, db, transitions, now):
+        """
+        Move each (ticket_id, sla, state) forward inside the caller's transaction
+        with one upsert. Returns the set of (ticket_id, sla) pairs this call moved
+        and should emit.
+        """
+        todo = []
+        for ticket_id, sla, state in transitions:
+            key = (ticket_id, sla)
+            current = self._states.get(key)
+            if current is not None:
+                self._states.move_to_end(key)
+                if RANK[current] >= RANK[state]:
+                    continue
+            todo.append((ticket_id, sla, state))
+        if not todo:
+            return set()
+        ticket_ids, slas, states = map(list, zip(*todo))
+        result = await db.execute(ADVANCE, {
+            "ticket_ids": ticket_ids, "slas": slas, "states": states, "now": now,
+        })
+        won = {tuple(row) for row in result}
+        # pairs that lost a race are stored at `state` or beyond already
+        for ticket_id, sla, state in todo:
+            self._states[(ticket_id, sla)] = state
+        while len(self._states) > self.maxsize:
+            self._states.popitem(last=False)
+        return won
+
+    def clear(self):
+        # the transaction that advanced cached states was rolled back
+        self._states.clear()
+
+alert_states = AlertStateCache()
@@ -1,30 +1,132 @@
+import hashlib
+import os
+import sys
+import threading
+from datetime import timedelta
+from types import MappingProxyType
+from typing import NamedTuple
 import yaml
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+# Fraction of an SLA left when the warning alert fires
+ALERT_RATIO = 0.15
+SLA_NAMES = ("response", "resolution")
+# editors emit several events per save; reload once they have settled
+SLA_RELOAD_DEBOUNCE = float(os.getenv("SLA_RELOAD_DEBOUNCE", "0.5"))
+
+class SLARule(NamedTuple):
+    seconds: int
+    due: timedelta
+    alert: timedelta
+
+class SLAPolicy:
+    """
+    Immutable compiled form of sla_config.yaml: (priority, tier) -> {sla_name: SLARule}
+    with the due and alert offsets precomputed. Replaced wholesale on reload, so a
+    reader holding a reference always sees one consistent version.
+    """
+    __slots__ = ("version", "digest", "data", "rules")
+
+    def __init__(self, data, version=0, digest=None):
+        rules = {}
+        for priority, tiers in (data or {}).items():
+            for tier, sla_items in (tiers or {}).items():
+                compiled = {}
+                for name in SLA_NAMES:
+                    seconds = (sla_items or {}).get(name)
+                    if seconds is not None:
+                        compiled[name] = SLARule(
+                            seconds, timedelta(seconds=seconds), timedelta(seconds=seconds * (1 - ALERT_RATIO))
+                        )
+                rules[(sys.intern(str(priority)), sys.intern(str(tier)))] = MappingProxyType(compiled)
+        self.version = version
+        self.digest = digest
+        self.data = data
+        self.rules = MappingProxyType(rules)
+
+    def lookup(self, priority, tier):
+        return self.rules.get((priority, tier), EMPTY_RULES)
+
+    def changed_pairs(self, previous):
+        """(priority, tier) keys whose rules differ from `previous`, or None if everything may have."""
+        if previous is None:
+            return None
+        keys = self.rules.keys() | previous.rules.keys()
+        return {k for k in keys if self.rules.get(k) != previous.rules.get(k)}
+
+EMPTY_RULES = MappingProxyType({})
+
 class SLAConfig:
     def __init__(self, path="sla_config.yaml"):
         self.path = path
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._pending = None
+        self.policy = None
         self._load()
         self._start_watcher()
 
+    @property
+    def data(self):
+        return self.policy.data
+
     def _load(self):
-        with open(self.path) as f:
-            self.data = yaml.safe_load(f)
-        print("Loaded SLA config", self.data)
+        """Compile the file and swap it in; returns the previous policy, or False if unchanged."""
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        previous = self.policy
+        if previous is not None and previous.digest == digest:
+            return False
+        version = 1 if previous is None else previous.version + 1
+        self.policy = SLAPolicy(yaml.safe_load(raw), version, digest)
+        print(f"Loaded SLA config v{version} ({len(self.policy.rules)} priority/tier rules)", flush=True)
+        return previous
+
+    def reload(self):
+        with self._lock:
+            previous = self._load()
+            if previous is False:
+                return
+            for listener in self._listeners:
+                try:
+                    listener(self.policy, previous)
+                except Exception as e:
+                    print("SLA config listener failed", e, flush=True)
+
+    def schedule_reload(self):
+        """Debounced reload for file events."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.cancel()
+            self._pending = threading.Timer(SLA_RELOAD_DEBOUNCE, self._reload_safely)
+            self._pending.daemon = True
+            self._pending.start()
+
+    def _reload_safely(self):
+        try:
+            self.reload()
+        except Exception as e:
+            # half-written or invalid file: keep the current policy
+            print("SLA config reload failed", e, flush=True)
+
+    def subscribe(self, listener):
+        """Call `listener(policy, previous)` after every reload that changed the file."""
+        self._listeners.append(listener)
 
     def _start_watcher(self):
         class ReloadHandler(FileSystemEventHandler):
             def __init__(self, outer): self.outer = outer
             def on_modified(self, event):
                 if event.src_path.endswith(self.outer.path):
-                    self.outer._load()
+                    self.outer.schedule_reload()
         observer = Observer()
         observer.schedule(ReloadHandler(self), path='.', recursive=False)
         observer.daemon = True
         observer.start()
 
     def get(self, priority, tier):
-        return self.data.get(priority, {}).get(tier, {})
+        return {name: rule.seconds for name, rule in self.policy.lookup(priority, tier).items()}
 
-config = SLAConfig()
\ No newline at end of file
+config = SLAConfig()
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import select, func, and_
+from app.db import AsyncSessionLocal
+from app.models import Ticket, TicketHistory
+
+# viewers within this many seconds of each other share one set of queries
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "5"))
+DASHBOARD_CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE", "256"))
+MAX_PAGE_SIZE = 500
+
+class TTLCache:
+    """
+    Short-lived results keyed by query parameters. Concurrent misses for the same
+    key await a single computation instead of each hitting the database.
+    """
+    def __init__(self, ttl=DASHBOARD_CACHE_TTL, max_entries=DASHBOARD_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    async def get(self, key, compute):
+        now = time.monotonic()
+        hit = self.entries.get(key)
+        if hit is not None and hit[0] > now:
+            return await asyncio.shield(hit[1])
+        task = asyncio.ensure_future(compute())
+        self.entries[key] = (now + self.ttl, task)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            # never cache failures
+            if self.entries.get(key, (None, None))[1] is task:
+                del self.entries[key]
+            raise
+
+cache = TTLCache()
+
+def _ticket_filters(status, priority, tier):
+    clauses = []
+    if status:
+        clauses.append(Ticket.status == status)
+    if priority:
+        clauses.append(Ticket.priority == priority)
+    if tier:
+        clauses.append(Ticket.customer_tier == tier)
+    return clauses
+
+# response-SLA states from the precomputed deadlines; the counts and the ticket
+# list filter by the same expressions, so a state's count matches its list
+def _alerting(now):
+    return and_(Ticket.response_alert_at <= now, Ticket.response_due_at > now)
+
+def _breached(now):
+    return Ticket.response_due_at <= now
+
+def _state_filter(state, now):
+    if state == "alerting":
+        return _alerting(now)
+    if state == "breached":
+        return _breached(now)
+    return None
+
+async def _counts(db, filters, now):
+    alerting = _alerting(now)
+    breached = _breached(now)
+    rows = (await db.execute(
+        select(
+            Ticket.status, Ticket.priority, Ticket.customer_tier,
+            func.count().label("tickets"),
+            func.count().filter(alerting).label("alerting"),
+            func.count().filter(breached).label("breached"),
+        )
+        .where(*filters)
+        .group_by(Ticket.status, Ticket.priority, Ticket.customer_tier)
+        .order_by(Ticket.status, Ticket.priority, Ticket.customer_tier)
+    )).mappings().all()
+    totals = {k: sum(r[k] for r in rows) for k in ("tickets", "alerting", "breached")}
+    return {"total": totals, "groups": [dict(r) for r in rows]}
+
+async def _tickets(db, filters, state, now, page, page_size):
+    where = list(filters)
+    flag = _state_filter(state, now)
+    if flag is not None:
+        where.append(flag)
+    total = (await db.execute(select(func.count()).select_from(Ticket).where(*where))).scalar_one()
+    remaining = func.extract("epoch", Ticket.response_due_at - now)
+    rows = (await db.execute(
+        select(
+            Ticket.id, Ticket.priority, Ticket.customer_tier, Ticket.status,
+            Ticket.created_at, Ticket.updated_at, Ticket.escalation_level,
+            remaining.label("remaining_response"),
+            func.coalesce(Ticket.response_alert_at <= now, False).label("alert"),
+            func.coalesce(Ticket.response_due_at <= now, False).label("breach"),
+        )
+        .where(*where)
+        # most urgent first; tickets without a response SLA last
+        .order_by(Ticket.response_due_at.asc().nulls_last(), Ticket.id)
+        .offset(page * page_size)
+        .limit(page_size)
+    )).mappings().all()
+    return {"page": page, "page_size": page_size, "total": total, "items": [dict(r) for r in rows]}
+
+async def _history(db, ticket_id, page, page_size):
+    where = [] if not ticket_id else [TicketHistory.ticket_id == ticket_id]
+    rows = (await db.execute(
+        select(
+            TicketHistory.id, TicketHistory.ticket_id, TicketHistory.old_status,
+            TicketHistory.new_status, TicketHistory.changed_at,
+        )
+        .where(*where)
+        .order_by(TicketHistory.changed_at.desc(), TicketHistory.id.desc())
+        .offset(page * page_size)
+        .limit(page_size + 1)
+    )).mappings().all()
+    # one extra row tells whether there is a next page without counting the table
+    return {
+        "page": page, "page_size": page_size,
+        "has_more": len(rows) > page_size,
+        "items": [dict(r) for r in rows[:page_size]],
+    }
+
+async def dashboard(status=None, priority=None, tier=None, state="alerting",
+                    page=0, page_size=100, history_ticket=None, history_page=0, history_page_size=100):
+    """Counts, one page of tickets and one page of status history, cached for DASHBOARD_CACHE_TTL."""
+    key = (status, priority, tier, state, page, page_size, history_ticket, history_page, history_page_size)
+
+    async def compute():
+        now = datetime.utcnow()
+        filters = _ticket_filters(status, priority, tier)
+        async with AsyncSessionLocal() as db:
+            return {
+                "generated_at": now,
+                "counts": await _counts(db, filters, now),
+                "tickets": await _tickets(db, filters, state, now, page, page_size),
+                "history": await _history(db, history_ticket, history_page, history_page_size),
+            }
+
+    return await cache.get(key, compute)
@@ -0,0 +1,231 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import delete, text
+from sqlalchemy.engine import make_url
+from app.db import ASYNC_DATABASE_URL, AsyncSessionLocal
+from app.models import SLAEvent
+
+# events a subscriber may lag behind before it is cut off; it then resumes from its cursor
+EVENT_CLIENT_BUFFER = int(os.getenv("EVENT_CLIENT_BUFFER", "1000"))
+# poll even without a NOTIFY, for rows held back while an older writer was still running
+EVENT_POLL_SECONDS = float(os.getenv("EVENT_POLL_SECONDS", "2"))
+EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))
+# how far back a reconnecting client can resume
+EVENT_RETENTION_HOURS = int(os.getenv("EVENT_RETENTION_HOURS", "24"))
+EVENT_BATCH = 1000
+# during a burst, how long the broker waits for lagging clients before cutting them off
+EVENT_SLOW_CLIENT_GRACE = 0.1
+
+CHANNEL = "sla_events"
+
+def publish(db, kind, ticket_id, data, now):
+    """Add an event to the caller's transaction; subscribers see it once that commits."""
+    db.add(SLAEvent(kind=kind, ticket_id=ticket_id, data=data, created_at=now))
+
+def prune_events(db, now=None):
+    """Delete events older than EVENT_RETENTION_HOURS (sync session). Caller commits."""
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=EVENT_RETENTION_HOURS)
+    db.execute(delete(SLAEvent).where(SLAEvent.created_at < cutoff))
+
+# Ids are allocated before commit, so a row can become visible after a higher id
+# already has, and a transaction holding low ids can commit after one with a lower
+# txid and higher ids. Only rows whose writing transaction is older than every
+# running one are passed on, in (txid, id) order, and the cursor is that pair: any
+# transaction still to commit has a txid at or above the snapshot's xmin, so
+# nothing can appear behind the high-water mark afterwards.
+SETTLED = """
+    SELECT txid, id, kind, ticket_id, data, created_at FROM sla_events
+    WHERE (txid, id) > ($1, $2) AND txid < pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+    ORDER BY txid, id LIMIT $3
+"""
+
+REPLAY = text("""
+    SELECT txid, id, kind, ticket_id, data, created_at FROM sla_events
+    WHERE (txid, id) > (:after_txid, :after_id) AND (txid, id) <= (:until_txid, :until_id)
+    ORDER BY txid, id LIMIT :limit
+""")
+
+def format_cursor(txid, event_id):
+    return f"{txid}-{event_id}"
+
+async def parse_cursor(value):
+    """
+    (txid, id) from an SSE event id "txid-id". A bare id from before the cursor
+    included the txid is resolved through its row; None if it can't be used.
+    """
+    txid, sep, event_id = value.partition("-")
+    if sep:
+        return (int(txid), int(event_id)) if txid.isdigit() and event_id.isdigit() else None
+    if not value.isdigit():
+        return None
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(text("SELECT txid, id FROM sla_events WHERE id = :id"), {"id": int(value)})).first()
+    return tuple(row) if row else None
+
+def sse_frame(txid, event_id, kind, ticket_id, data, created_at):
+    if isinstance(data, str):
+        data = json.loads(data)
+    body = json.dumps({
+        "id": event_id, "kind": kind, "ticket_id": ticket_id,
+        "created_at": created_at.isoformat(), "data": data,
+    })
+    return f"id: {format_cursor(txid, event_id)}\nevent: {kind}\ndata: {body}\n\n"
+
+class Subscription:
+    def __init__(self, kinds, start, maxsize):
+        self.kinds = kinds
+        # events up to this (txid, id) come from the table, later ones from the queue
+        self.start = start
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def offer(self, kind, frame):
+        if self.overflowed or (self.kinds and kind not in self.kinds):
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+class EventBroker:
+    """
+    One LISTEN connection per process. On each NOTIFY (or every
+    EVENT_POLL_SECONDS) it reads the new settled rows of `sla_events` once, formats
+    each as an SSE frame once and hands the same string to every subscriber's
+    bounded queue. A subscriber that falls EVENT_CLIENT_BUFFER events behind is
+    dropped rather than buffered; it reconnects with its last event id and catches
+    up from the table.
+    """
+    def __init__(self, buffer=EVENT_CLIENT_BUFFER, poll_seconds=EVENT_POLL_SECONDS):
+        self.buffer = buffer
+        self.poll_seconds = poll_seconds
+        self.subscribers = set()
+        self.high_water = None
+        self.conn = None
+        self.task = None
+        self._wake = asyncio.Event()
+        self._ready = asyncio.Event()
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self._disconnect()
+
+    async def subscribe(self, kinds=None):
+        await self._ready.wait()
+        sub = Subscription(kinds, self.high_water, self.buffer)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self.subscribers.discard(sub)
+
+    async def _connect(self):
+        import asyncpg
+        dsn = make_url(ASYNC_DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.conn = await asyncpg.connect(dsn)
+        await self.conn.add_listener(CHANNEL, lambda *args: self._wake.set())
+        if self.high_water is None:
+            row = await self.conn.fetchrow(
+                "SELECT txid, id FROM sla_events"
+                " WHERE txid < pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+                " ORDER BY txid DESC, id DESC LIMIT 1"
+            )
+            self.high_water = (row["txid"], row["id"]) if row else (0, 0)
+        self._ready.set()
+
+    async def _disconnect(self):
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            try:
+                await conn.close()
+            except Exception:
+                pass
+
+    async def _drain(self):
+        # never hand out more than one buffer's worth between chances for clients to read
+        limit = min(EVENT_BATCH, self.buffer)
+        while True:
+            rows = await self.conn.fetch(SETTLED, *self.high_water, limit)
+            for row in rows:
+                frame = sse_frame(
+                    row["txid"], row["id"], row["kind"], row["ticket_id"], row["data"], row["created_at"],
+                )
+                for sub in tuple(self.subscribers):
+                    sub.offer(row["kind"], frame)
+            if rows:
+                self.high_water = (rows[-1]["txid"], rows[-1]["id"])
+            if len(rows) < limit:
+                return
+            await self._make_room(limit)
+
+    async def _make_room(self, need):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + EVENT_SLOW_CLIENT_GRACE
+        while loop.time() < deadline and any(
+            not s.overflowed and s.queue.maxsize - s.queue.qsize() < need for s in self.subscribers
+        ):
+            await asyncio.sleep(0.005)
+
+    async def _run(self):
+        while True:
+            try:
+                if self.conn is None:
+                    await self._connect()
+                self._wake.clear()
+                await self._drain()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # a missed NOTIFY is harmless: the next drain reads from the high-water mark
+                print("Event feed failed", e, flush=True)
+                await self._disconnect()
+                await asyncio.sleep(self.poll_seconds)
+
+    async def stream(self, cursor=None, kinds=None):
+        """SSE frames: events after the (txid, id) `cursor` from the table, then live ones."""
+        sub = await self.subscribe(kinds)
+        try:
+            yield f"retry: {int(self.poll_seconds * 1000)}\n\n"
+            after = cursor
+            while after is not None and after < sub.start:
+                async with AsyncSessionLocal() as db:
+                    rows = (await db.execute(REPLAY, {
+                        "after_txid": after[0], "after_id": after[1],
+                        "until_txid": sub.start[0], "until_id": sub.start[1], "limit": EVENT_BATCH,
+                    })).all()
+                if not rows:
+                    break
+                for row in rows:
+                    if not kinds or row.kind in kinds:
+                        yield sse_frame(row.txid, row.id, row.kind, row.ticket_id, row.data, row.created_at)
+                after = (rows[-1].txid, rows[-1].id)
+            while True:
+                if sub.overflowed and sub.queue.empty():
+                    # the client reconnects with its Last-Event-ID and replays the gap
+                    yield "event: overflow\ndata: {}\n\n"
+                    return
+                if not sub.queue.empty():
+                    # whatever is already queued goes out as one chunk
+                    frames = [sub.queue.get_nowait() for _ in range(sub.queue.qsize())]
+                    yield "".join(frames)
+                    continue
+                try:
+                    yield await asyncio.wait_for(sub.queue.get(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(sub)
+
+broker = EventBroker()
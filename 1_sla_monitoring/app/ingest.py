@@ -0,0 +1,264 @@
+import csv
+import os
+from datetime import datetime, timezone
+from sqlalchemy import text, bindparam, String, DateTime, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from app.config import config
+from app.sla import deadline_columns, DEADLINE_COLUMNS
+from app.leases import shard_of
+
+# Rows per statement; bounds the size of the array parameters sent in one go
+CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "10000"))
+# Rows per transaction for streamed uploads (POST /tickets/stream)
+STREAM_CHUNK_SIZE = int(os.getenv("INGEST_STREAM_CHUNK_SIZE", "5000"))
+# Longest accepted NDJSON/CSV line, so a body without newlines cannot pile up in memory
+MAX_LINE_BYTES = int(os.getenv("INGEST_MAX_LINE_BYTES", str(1 << 20)))
+# Invalid rows (and failed chunks) reported back individually; the rest are only counted
+MAX_REPORTED_ERRORS = int(os.getenv("INGEST_MAX_REPORTED_ERRORS", "100"))
+
+COLUMN_TYPES = {
+    "id": String,
+    "priority": String,
+    "created_at": DateTime,
+    "updated_at": DateTime,
+    "status": String,
+    "customer_tier": String,
+    **dict.fromkeys(DEADLINE_COLUMNS, DateTime),
+    "ingested_at": DateTime,
+    "shard": Integer,
+}
+
+UPSERT_COLUMNS = tuple(c for c in COLUMN_TYPES if c != "id")
+
+def _upsert_sql():
+    """
+    Single statement that upserts a batch and records a TicketHistory row and a
+    'status' SLAEvent for every ticket whose status changed; selects (upserted,
+    history_written). Each column
+    travels as one array parameter and is unnested server side, so the statement is
+    independent of the batch size. Plain text because the postgresql Insert
+    construct is excluded from SQLAlchemy's compiled cache, and recompiling it
+    dominated small batches.
+    """
+    cols = ", ".join(COLUMN_TYPES)
+    return text(f"""
+        WITH incoming AS (
+            SELECT * FROM unnest({", ".join(f":in_{c}" for c in COLUMN_TYPES)}) AS i({cols})
+        ),
+        -- all CTEs share one snapshot, so `prev` sees the statuses before the upsert
+        prev AS (
+            SELECT t.id, t.status FROM tickets t JOIN incoming USING (id)
+        ),
+        upserted AS (
+            INSERT INTO tickets ({cols}, escalation_level)
+            SELECT {cols}, 0 FROM incoming
+            ON CONFLICT (id) DO UPDATE SET
+                {", ".join(f"{c} = excluded.{c}" for c in UPSERT_COLUMNS)}
+            RETURNING id, status
+        ),
+        history AS (
+            INSERT INTO ticket_history (ticket_id, old_status, new_status, changed_at)
+            SELECT prev.id, prev.status, upserted.status, :changed_at
+            FROM prev JOIN upserted USING (id)
+            WHERE prev.status <> upserted.status
+            RETURNING ticket_id, old_status, new_status
+        ),
+        events AS (
+            INSERT INTO sla_events (kind, ticket_id, data, created_at)
+            SELECT 'status', ticket_id,
+                   json_build_object('old_status', old_status, 'new_status', new_status), :changed_at
+            FROM history
+        )
+        SELECT (SELECT count(*) FROM upserted), (SELECT count(*) FROM history)
+    """).bindparams(
+        *[bindparam(f"in_{c}", type_=ARRAY(t)) for c, t in COLUMN_TYPES.items()],
+        bindparam("changed_at", type_=DateTime),
+    )
+
+UPSERT = _upsert_sql()
+
+def upsert_params(rows, changed_at):
+    params = {f"in_{c}": [r[c] for r in rows] for c in COLUMN_TYPES}
+    params["changed_at"] = changed_at
+    return params
+
+def dedupe(rows):
+    # ON CONFLICT cannot touch the same row twice in one statement; last write wins.
+    # Id order makes concurrent upserts and SLA ticks lock rows in the same order.
+    return sorted({r["id"]: r for r in rows}.values(), key=lambda r: r["id"])
+
+def utc_naive(dt):
+    # timestamp columns hold naive UTC
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+def with_deadlines(row, ingested_at, policy):
+    row = {**row, "created_at": utc_naive(row["created_at"]), "updated_at": utc_naive(row["updated_at"])}
+    return {
+        **row,
+        **deadline_columns(policy.lookup(row["priority"], row["customer_tier"]), row["created_at"]),
+        "ingested_at": ingested_at,
+        "shard": shard_of(row["id"]),
+    }
+
+def prepare_rows(rows, changed_at):
+    """Deduplicated ticket dicts with SLA deadlines filled in from the current config."""
+    # one policy version for the whole batch, even if a reload lands mid-way
+    policy = config.policy
+    return [with_deadlines(r, changed_at, policy) for r in dedupe(rows)]
+
+async def upsert_rows(db, rows, changed_at):
+    """
+    Upsert prepared rows in CHUNK_SIZE statements on an AsyncSession. Caller commits.
+    Returns (upserted, history_written).
+    """
+    upserted = history = 0
+    for i in range(0, len(rows), CHUNK_SIZE):
+        n, h = (await db.execute(UPSERT, upsert_params(rows[i:i + CHUNK_SIZE], changed_at))).one()
+        upserted += n
+        history += h
+    return upserted, history
+
+async def upsert_tickets(db, rows, changed_at=None):
+    changed_at = changed_at or datetime.utcnow()
+    return await upsert_rows(db, prepare_rows(rows, changed_at), changed_at)
+
+class LineTooLong(ValueError):
+    pass
+
+async def iter_lines(chunks, max_line=MAX_LINE_BYTES):
+    """Split an async iterator of body chunks into lines without buffering the body."""
+    buf = b""
+    async for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buf) > max_line:
+            raise LineTooLong(f"line longer than {max_line} bytes")
+    if buf:
+        yield buf
+
+async def csv_records(lines, max_record=MAX_LINE_BYTES):
+    """
+    Group physical lines into CSV records: a line ending inside a quoted field
+    (an odd number of quotes so far) continues on the next one, so quoted fields
+    may contain newlines. Yields (first line number, record bytes).
+    """
+    lineno = 0
+    start, parts, quotes, size = None, [], 0, 0
+    async for raw in lines:
+        lineno += 1
+        if start is None:
+            start = lineno
+        parts.append(raw)
+        quotes += raw.count(b'"')
+        size += len(raw) + 1
+        if quotes % 2:
+            if size > max_record:
+                raise LineTooLong(f"quoted field from line {start} longer than {max_record} bytes")
+            continue
+        yield start, b"\n".join(parts)
+        start, parts, quotes, size = None, [], 0, 0
+    if parts:
+        # still inside quotes at the end of the body; the csv module rejects it
+        yield start, b"\n".join(parts)
+
+async def numbered(lines):
+    lineno = 0
+    async for raw in lines:
+        lineno += 1
+        yield lineno, raw
+
+async def parse_records(lines, fmt, model):
+    """
+    Yield (line_number, ticket dict) per NDJSON line or CSV record (first record
+    is the header; quoted fields may span lines), validated with the pydantic
+    `model`; invalid rows, including CSV rows with more or fewer fields than the
+    header, yield the exception.
+    """
+    header = None
+    async for lineno, raw in (csv_records(lines) if fmt == "csv" else numbered(lines)):
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            if fmt == "csv":
+                values = next(csv.reader([line.decode()], strict=True))
+                if header is None:
+                    header = [h.strip() for h in values]
+                    continue
+                if len(values) != len(header):
+                    raise ValueError(f"row has {len(values)} fields, header has {len(header)}")
+                yield lineno, model.model_validate(dict(zip(header, values))).model_dump()
+            else:
+                yield lineno, model.model_validate_json(line).model_dump()
+        except (ValueError, csv.Error) as e:
+            # pydantic's ValidationError and UnicodeDecodeError are ValueErrors;
+            # csv.Error covers a bare \r in an unquoted field or an unclosed quote
+            yield lineno, e
+
+def describe_error(e):
+    # pydantic's multi-line message boiled down to "field: problem" pairs
+    if hasattr(e, "errors"):
+        return "; ".join(f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in e.errors())
+    return str(e)
+
+async def ingest_stream(db, records, chunk_size=STREAM_CHUNK_SIZE, on_commit=None):
+    """
+    Upsert `records` (see parse_records) in transactions of `chunk_size` rows. The
+    next chunk is only read once the previous one is committed, so a slow database
+    pushes back on the sender. A failing chunk is rolled back and reported; later
+    chunks still run. `on_commit(rows)` sees each committed chunk's prepared rows.
+    Only failed chunks are reported individually, up to MAX_REPORTED_ERRORS like
+    invalid rows, so the summary stays small however long the upload.
+    """
+    summary = {
+        "rows": 0, "upserted": 0, "history": 0, "invalid": 0,
+        "chunks": 0, "failed_chunks": 0, "chunk_errors": [], "errors": [],
+    }
+    chunk = []
+    first_line = None
+
+    async def flush(last_line):
+        nonlocal chunk, first_line
+        if not chunk:
+            return
+        report = {"chunk": summary["chunks"], "first_line": first_line, "last_line": last_line, "rows": len(chunk)}
+        summary["chunks"] += 1
+        changed_at = datetime.utcnow()
+        rows = prepare_rows(chunk, changed_at)
+        chunk, first_line = [], None
+        try:
+            upserted, history = await upsert_rows(db, rows, changed_at)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            summary["failed_chunks"] += 1
+            if len(summary["chunk_errors"]) < MAX_REPORTED_ERRORS:
+                summary["chunk_errors"].append(dict(report, error=str(e).splitlines()[0]))
+        else:
+            summary["rows"] += report["rows"]
+            summary["upserted"] += upserted
+            summary["history"] += history
+            if on_commit is not None:
+                on_commit(rows)
+
+    lineno = 0
+    try:
+        async for lineno, record in records:
+            if isinstance(record, Exception):
+                summary["invalid"] += 1
+                if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                    summary["errors"].append({"line": lineno, "error": describe_error(record)})
+                continue
+            if first_line is None:
+                first_line = lineno
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                await flush(lineno)
+    except LineTooLong as e:
+        summary["aborted"] = str(e)
+    await flush(lineno)
+    return summary
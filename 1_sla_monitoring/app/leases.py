@@ -0,0 +1,124 @@
+import math
+import os
+import socket
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, func, text, bindparam, Integer, String
+from sqlalchemy.dialects.postgresql import insert, ARRAY
+from app.models import Ticket, SLALease, SLAWorker
+
+# Fixed per deployment: tickets are assigned to partitions at ingest
+SLA_PARTITIONS = int(os.getenv("SLA_PARTITIONS", "64"))
+# a worker that misses heartbeats this long loses its partitions
+SLA_LEASE_SECONDS = int(os.getenv("SLA_LEASE_SECONDS", "30"))
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+def shard_of(ticket_id):
+    return zlib.crc32(ticket_id.encode()) % SLA_PARTITIONS
+
+class PartitionLeases:
+    """
+    Splits SLA evaluation across workers. Every worker heartbeats into
+    `sla_workers` and holds leases on ceil(partitions / live workers) rows of
+    `sla_leases`, renewing them on each rebalance. A dead worker's leases expire
+    after SLA_LEASE_SECONDS and are claimed by the survivors; a worker above its
+    fair share releases the surplus so newcomers can pick it up.
+    """
+    def __init__(self, worker_id=WORKER_ID, partitions=SLA_PARTITIONS, lease_seconds=SLA_LEASE_SECONDS):
+        self.worker_id = worker_id
+        self.partitions = partitions
+        self.lease_seconds = lease_seconds
+        self.owned = frozenset()
+        self._acquired = set()
+
+    def owns(self, ticket_id):
+        return shard_of(ticket_id) in self.owned
+
+    def take_acquired(self):
+        """Partitions gained since the last call; their tickets need a catch-up scan."""
+        acquired, self._acquired = self._acquired, set()
+        return acquired & self.owned
+
+    async def rebalance(self, db):
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=self.lease_seconds)
+        await db.execute(
+            insert(SLAWorker).values(worker_id=self.worker_id, heartbeat_at=now)
+            .on_conflict_do_update(index_elements=[SLAWorker.worker_id], set_={"heartbeat_at": now})
+        )
+        await db.execute(delete(SLAWorker).where(
+            SLAWorker.heartbeat_at < now - timedelta(seconds=10 * self.lease_seconds)
+        ))
+        await db.execute(
+            insert(SLALease).from_select(["partition"], select(func.generate_series(0, self.partitions - 1)))
+            .on_conflict_do_nothing()
+        )
+        live = (await db.execute(select(func.count()).select_from(SLAWorker).where(
+            SLAWorker.heartbeat_at > now - timedelta(seconds=self.lease_seconds)
+        ))).scalar_one()
+        share = math.ceil(self.partitions / max(live, 1))
+
+        mine = set((await db.execute(
+            update(SLALease)
+            .where(SLALease.owner == self.worker_id, SLALease.partition < self.partitions)
+            .values(expires_at=expires)
+            .returning(SLALease.partition)
+        )).scalars())
+        if len(mine) > share:
+            surplus = sorted(mine)[share:]
+            await db.execute(
+                update(SLALease).where(SLALease.partition.in_(surplus))
+                .values(owner=None, expires_at=now)
+            )
+            mine -= set(surplus)
+        elif len(mine) < share:
+            free = (
+                select(SLALease.partition)
+                .where(
+                    SLALease.partition < self.partitions,
+                    (SLALease.owner.is_(None)) | (SLALease.expires_at < now),
+                )
+                .order_by(SLALease.partition)
+                .limit(share - len(mine))
+                .with_for_update(skip_locked=True)
+            )
+            mine |= set((await db.execute(
+                update(SLALease)
+                .where(SLALease.partition.in_(free.scalar_subquery()))
+                .values(owner=self.worker_id, expires_at=expires)
+                .returning(SLALease.partition)
+            )).scalars())
+        await db.commit()
+        self._acquired |= mine - self.owned
+        changed = mine != self.owned
+        self.owned = frozenset(mine)
+        return changed
+
+    async def release(self, db):
+        await db.execute(
+            update(SLALease).where(SLALease.owner == self.worker_id)
+            .values(owner=None, expires_at=datetime.utcnow())
+        )
+        await db.execute(delete(SLAWorker).where(SLAWorker.worker_id == self.worker_id))
+        await db.commit()
+        self.owned = frozenset()
+
+BACKFILL_SHARDS = text("""
+    UPDATE tickets SET shard = i.shard
+    FROM unnest(:ids, :shards) AS i(id, shard)
+    WHERE tickets.id = i.id
+""").bindparams(
+    bindparam("ids", type_=ARRAY(String)),
+    bindparam("shards", type_=ARRAY(Integer)),
+)
+
+def backfill_shards(db, batch=10_000):
+    """Assign partitions to tickets stored before sharding (sync session). Caller commits."""
+    while True:
+        ids = db.execute(select(Ticket.id).where(Ticket.shard.is_(None)).limit(batch)).scalars().all()
+        if not ids:
+            return
+        db.execute(BACKFILL_SHARDS, {"ids": ids, "shards": [shard_of(i) for i in ids]})
+
+leases = PartitionLeases()
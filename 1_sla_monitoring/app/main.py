@@ -1,17 +1,30 @@
-from fastapi import FastAPI, Depends
-from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import OperationalError
-from typing import List
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 from datetime import datetime
+import asyncio
 import time
 
-from app.db import get_db, engine, Base
-from app.models import Ticket, TicketHistory
-from app.scheduler import start_scheduler
+from app.db import get_async_db, engine, async_engine, Base
+from app.ingest import (
+    prepare_rows, upsert_rows, iter_lines, parse_records, ingest_stream, STREAM_CHUNK_SIZE,
+)
+from app.scheduler import start_scheduler, startup_maintenance, release_partitions, timer_engine
+from app.slack import dispatcher
+from app.dashboard import dashboard, MAX_PAGE_SIZE
+from app.events import broker, parse_cursor
+from app.metrics import (
+    RequestTimer, time_queries, render, profiler, PROFILER_ENABLED, PROFILER_MAX_SECONDS,
+)
 
 app = FastAPI()
+app.add_middleware(RequestTimer)
+time_queries(engine, "sync")
+time_queries(async_engine, "async")
 
 @app.on_event("startup")
 def on_startup():
@@ -24,7 +37,17 @@ def on_startup():
             retries -= 1
             time.sleep(2)
     Base.metadata.create_all(bind=engine)
+    # deadlines may be stale if sla_config.yaml changed while we were down
+    startup_maintenance()
     start_scheduler()
+    broker.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await dispatcher.close()
+    await broker.close()
+    await release_partitions()
+    await async_engine.dispose()
 
 class TicketIn(BaseModel):
     id: str
@@ -35,33 +58,94 @@ class TicketIn(BaseModel):
     customer_tier: str
 
 @app.post("/tickets")
-async def ingest_tickets(tickets: List[TicketIn], db: Session = Depends(get_db)):
-    for t in tickets:
-        stmt = insert(Ticket).values(
-            id=t.id,
-            priority=t.priority,
-            created_at=t.created_at,
-            updated_at=t.updated_at,
-            status=t.status,
-            customer_tier=t.customer_tier
-        ).on_conflict_do_update(
-            index_elements=[Ticket.id],
-            set_={
-                'priority': t.priority,
-                'created_at': t.created_at,
-                'updated_at': t.updated_at,
-                'status': t.status,
-                'customer_tier': t.customer_tier
-            }
-        )
-        existing = db.get(Ticket, t.id)
-        if existing and existing.status != t.status:
-            db.add(TicketHistory(
-                ticket_id=t.id,
-                old_status=existing.status,
-                new_status=t.status,
-                changed_at=datetime.utcnow()
-            ))
-        db.execute(stmt)
-    db.commit()
-    return {"ingested": len(tickets)}
\ No newline at end of file
+async def ingest_tickets(tickets: List[TicketIn], db: AsyncSession = Depends(get_async_db)):
+    now = datetime.utcnow()
+    rows = prepare_rows([t.model_dump() for t in tickets], now)
+    await upsert_rows(db, rows, now)
+    await db.commit()
+    if timer_engine.running:
+        timer_engine.schedule_rows(rows)
+    return {"ingested": len(tickets)}
+
+@app.post("/tickets/stream")
+async def ingest_ticket_stream(
+    request: Request,
+    format: Optional[Literal["ndjson", "csv"]] = None,
+    chunk_size: int = Query(STREAM_CHUNK_SIZE, ge=1, le=100_000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Bulk ingest from an NDJSON or CSV body (by `format`, else Content-Type), parsed
+    as it arrives and committed every `chunk_size` rows. Returns totals, failed chunks
+    and the first invalid rows; committed chunks stay even if later ones fail.
+    """
+    if format is None:
+        format = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "ndjson"
+
+    def on_commit(rows):
+        if timer_engine.running:
+            timer_engine.schedule_rows(rows)
+
+    records = parse_records(iter_lines(request.stream()), format, TicketIn)
+    summary = await ingest_stream(db, records, chunk_size, on_commit)
+    return JSONResponse(jsonable_encoder(summary), status_code=413 if "aborted" in summary else 200)
+
+@app.get("/dashboard")
+async def get_dashboard(
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    tier: Optional[str] = None,
+    state: Literal["all", "alerting", "breached"] = "alerting",
+    page: int = Query(0, ge=0),
+    page_size: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    history_ticket: Optional[str] = None,
+    history_page: int = Query(0, ge=0),
+    history_page_size: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+):
+    return await dashboard(
+        status, priority, tier, state, page, page_size,
+        history_ticket, history_page, history_page_size,
+    )
+
+@app.get("/events")
+async def stream_events(request: Request, cursor: Optional[str] = None, kinds: Optional[str] = None):
+    """
+    Server-Sent Events feed of ticket status changes and alert/breach events.
+    Resumes after `cursor` or the Last-Event-ID header (an event's `id:`);
+    `kinds` is a comma separated subset of status, alert, breach.
+    """
+    cursor = request.headers.get("last-event-id") or cursor
+    if cursor:
+        cursor = await parse_cursor(cursor)
+    wanted = frozenset(k.strip() for k in kinds.split(",") if k.strip()) if kinds else None
+    return StreamingResponse(
+        broker.stream(cursor, wanted),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics")
+def metrics():
+    body, content_type = render()
+    return Response(body, media_type=content_type)
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10, gt=0, le=PROFILER_MAX_SECONDS),
+    interval: float = Query(0.005, ge=0.001, le=1),
+):
+    """
+    Sample all threads for `seconds` and return collapsed stacks for a flame graph.
+    Only with PROFILER_ENABLED; one profile at a time.
+    """
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404)
+    try:
+        profiler.start(interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+    return profiler.collapsed()
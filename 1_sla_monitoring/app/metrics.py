@@ -0,0 +1,134 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from prometheus_client import Histogram, CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import event
+
+# GET /debug/profile is only served when this is set
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "").lower() in ("1", "true", "yes")
+PROFILER_MAX_SECONDS = 60
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to response headers per endpoint",
+    ["method", "route", "status"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Statement execution time", ["engine", "operation"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+TICK_SECONDS = Histogram(
+    "sla_tick_duration_seconds", "Poll tick duration",
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60),
+)
+TICK_TICKETS = Histogram(
+    "sla_tick_tickets", "Tickets evaluated per poll tick",
+    buckets=(0, 10, 100, 1_000, 10_000, 100_000, 1_000_000),
+)
+DISPATCH_SECONDS = Histogram(
+    "sla_alert_dispatch_seconds", "Time from an alert being staged to its webhook delivery",
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+WEBHOOK_POST_SECONDS = Histogram("sla_webhook_post_seconds", "One webhook POST, retries included")
+
+class RequestTimer:
+    """ASGI middleware observing REQUEST_SECONDS by route template, up to the response headers."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        observed = False
+
+        def observe(status):
+            nonlocal observed
+            if not observed:
+                observed = True
+                route = scope.get("route")
+                REQUEST_SECONDS.labels(
+                    scope["method"], getattr(route, "path", "unmatched"), str(status)
+                ).observe(time.perf_counter() - start)
+
+        async def timed_send(message):
+            # streamed bodies (/events) would otherwise count their whole lifetime
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            observe(500)
+
+def time_queries(engine, label):
+    """Observe DB_QUERY_SECONDS for every statement run on `engine` (sync Engine or AsyncEngine)."""
+    target = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(target, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(target, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+        DB_QUERY_SECONDS.labels(label, operation).observe(time.perf_counter() - context._query_start)
+
+def render():
+    """(body, content type) of the Prometheus exposition."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+class SamplingProfiler:
+    """
+    Samples every thread's stack each `interval` seconds from a background thread
+    and counts them as collapsed stacks ("outer;...;inner count", the input
+    format of flamegraph.pl and speedscope). Costs nothing while not running.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=None):
+        with self._lock:
+            if self._thread is not None:
+                raise RuntimeError("profiler already running")
+            self.interval = interval or self.interval
+            self.samples = Counter()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        return self.samples
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {n}\n" for stack, n in self.samples.most_common())
+
+profiler = SamplingProfiler()
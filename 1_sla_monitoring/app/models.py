@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, ForeignKey, Index, JSON, DDL, event, text
 from sqlalchemy.orm import relationship
 from app.db import Base
 
@@ -11,24 +11,138 @@ class Ticket(Base):
     status = Column(String, nullable=False)
     customer_tier = Column(String, nullable=False)
     escalation_level = Column(Integer, default=0)
+    # SLA deadlines precomputed from sla_config.yaml (see app.sla)
+    response_alert_at = Column(DateTime, nullable=True)
+    response_due_at = Column(DateTime, nullable=True)
+    resolution_alert_at = Column(DateTime, nullable=True)
+    resolution_due_at = Column(DateTime, nullable=True)
+    ingested_at = Column(DateTime, nullable=True)
+    # SLA evaluation partition, see app.leases.shard_of
+    shard = Column(Integer, nullable=True)
     history = relationship("TicketHistory", back_populates="ticket")
     alerts = relationship("Alert", back_populates="ticket")
 
+    # the SLA checker only ever looks at open tickets of the partitions it owns
+    __table_args__ = tuple(
+        Index(f"ix_tickets_open_{col}", "shard", col, postgresql_where=text("status = 'open'"))
+        for col in (
+            "response_alert_at", "response_due_at",
+            "resolution_alert_at", "resolution_due_at",
+            "ingested_at",
+        )
+    ) + (
+        # dashboard: tickets ordered by urgency across all statuses
+        Index("ix_tickets_response_due_at", "response_due_at"),
+    )
+
+# ticket_history and alerts are range-partitioned by month on their timestamp
+# (see app.partitions); the partition key has to be part of the primary key.
 class TicketHistory(Base):
     __tablename__ = "ticket_history"
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     ticket_id = Column(String, ForeignKey('tickets.id'), nullable=False)
     old_status = Column(String, nullable=False)
     new_status = Column(String, nullable=False)
-    changed_at = Column(DateTime, nullable=False)
+    changed_at = Column(DateTime, primary_key=True, index=True)
     ticket = relationship("Ticket", back_populates="history")
 
+    __table_args__ = (
+        Index("ix_ticket_history_ticket_changed", "ticket_id", "changed_at"),
+        {"postgresql_partition_by": "RANGE (changed_at)"},
+    )
+
 class Alert(Base):
     __tablename__ = "alerts"
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     ticket_id = Column(String, ForeignKey('tickets.id'), nullable=False)
     event = Column(String, nullable=False)  # 'alert' or 'breach'
     sla = Column(String, nullable=True)
     remaining = Column(Integer, nullable=True)
+    created_at = Column(DateTime, primary_key=True, index=True)
+    ticket = relationship("Ticket", back_populates="alerts")
+
+    __table_args__ = (
+        Index("ix_alerts_ticket_created", "ticket_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+class BreachRollup(Base):
+    """Alerts and breaches per hour and priority/tier, kept after raw partitions are dropped."""
+    __tablename__ = "sla_rollups_hourly"
+    hour = Column(DateTime, primary_key=True)
+    priority = Column(String, primary_key=True)
+    customer_tier = Column(String, primary_key=True)
+    sla = Column(String, primary_key=True)
+    alerts = Column(Integer, nullable=False)
+    breaches = Column(Integer, nullable=False)
+
+class AlertState(Base):
+    """Furthest alert emitted per (ticket, sla): 'warned' then 'breached'."""
+    __tablename__ = "alert_states"
+    ticket_id = Column(String, ForeignKey('tickets.id'), primary_key=True)
+    sla = Column(String, primary_key=True)
+    state = Column(String, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+class AlertOutbox(Base):
+    """Alerts awaiting delivery, written in the same transaction as the Alert row."""
+    __tablename__ = "alert_outbox"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    payload = Column(JSON, nullable=False)
     created_at = Column(DateTime, nullable=False)
-    ticket = relationship("Ticket", back_populates="alerts")
\ No newline at end of file
+    # rows are claimed by pushing this into the future; unsent rows reappear once it passes
+    next_attempt_at = Column(DateTime, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    sent_at = Column(DateTime, nullable=True)
+    # rejected by the webhook or out of attempts; never claimed again
+    failed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_alert_outbox_pending", "next_attempt_at",
+              postgresql_where=text("sent_at IS NULL AND failed_at IS NULL")),
+    )
+
+class SLALease(Base):
+    """Ownership of one SLA evaluation partition."""
+    __tablename__ = "sla_leases"
+    partition = Column(Integer, primary_key=True)
+    owner = Column(String, nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+
+class SLAWorker(Base):
+    __tablename__ = "sla_workers"
+    worker_id = Column(String, primary_key=True)
+    heartbeat_at = Column(DateTime, nullable=False)
+
+class SLAEvent(Base):
+    """
+    Change feed of status transitions and alerts/breaches, written in the same
+    transaction as the change itself and streamed to subscribers (see app.events).
+    """
+    __tablename__ = "sla_events"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)  # 'status', 'alert' or 'breach'
+    ticket_id = Column(String, nullable=False)
+    data = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+    # writing transaction; readers only pass rows whose writers have all finished,
+    # in (txid, id) order
+    txid = Column(BigInteger, nullable=False, server_default=text("pg_current_xact_id()::text::bigint"))
+
+    __table_args__ = (
+        Index("ix_sla_events_txid_id", "txid", "id"),
+    )
+
+# one NOTIFY per writing transaction (Postgres folds duplicates), delivered at commit
+event.listen(SLAEvent.__table__, "after_create", DDL("""
+    CREATE OR REPLACE FUNCTION notify_sla_events() RETURNS trigger AS $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM new_rows) THEN
+            PERFORM pg_notify('sla_events', '');
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+    CREATE TRIGGER sla_events_notify AFTER INSERT ON sla_events
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_sla_events();
+"""))
@@ -0,0 +1,122 @@
+import os
+import re
+from datetime import datetime
+from sqlalchemy import text
+from app.events import prune_events
+
+# months of partitions kept ahead of the current one
+PARTITION_PREMAKE_MONTHS = int(os.getenv("PARTITION_PREMAKE_MONTHS", "2"))
+# whole months of raw history/alerts kept; older partitions are dropped (0 keeps everything)
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "12"))
+
+# partitioned table -> partition key
+PARTITIONED = {"ticket_history": "changed_at", "alerts": "created_at"}
+
+# how often alerts are rolled up and partitions created/dropped
+PARTITION_MAINTENANCE_SECONDS = int(os.getenv("PARTITION_MAINTENANCE_SECONDS", "300"))
+
+# arbitrary key serializing partition DDL and rollups across workers
+PARTITION_LOCK_KEY = 0x51B
+
+PARTITION_NAME = re.compile(r"_y(\d{4})m(\d{2})$")
+
+def month_start(dt):
+    return datetime(dt.year, dt.month, 1)
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def partition_name(table, month):
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+def ensure_partitions(db, now=None, since=None):
+    """
+    Create the monthly partitions from `since` (default: this month) through
+    PARTITION_PREMAKE_MONTHS ahead. Idempotent; caller commits.
+    """
+    now = now or datetime.utcnow()
+    first = month_start(since or now)
+    last = add_months(month_start(now), PARTITION_PREMAKE_MONTHS)
+    db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": PARTITION_LOCK_KEY})
+    month = first
+    while month <= last:
+        for table in PARTITIONED:
+            db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            ))
+        month = add_months(month, 1)
+
+def list_partitions(db, table):
+    """(name, month) of every monthly partition of `table`, oldest first."""
+    names = db.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = CAST(:table AS regclass)
+    """), {"table": table}).scalars()
+    parts = []
+    for name in names:
+        m = PARTITION_NAME.search(name)
+        if m:
+            parts.append((name, datetime(int(m.group(1)), int(m.group(2)), 1)))
+    return sorted(parts, key=lambda p: p[1])
+
+def drop_expired_partitions(db, now=None, retention_months=PARTITION_RETENTION_MONTHS):
+    """
+    Drop whole partitions that ended more than `retention_months` ago: a catalog
+    operation instead of a DELETE over millions of rows. Caller commits.
+    """
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(now or datetime.utcnow()), -retention_months)
+    db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": PARTITION_LOCK_KEY})
+    dropped = []
+    for table in PARTITIONED:
+        for name, month in list_partitions(db, table):
+            if add_months(month, 1) <= cutoff:
+                db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+    return dropped
+
+ROLLUP = text("""
+    INSERT INTO sla_rollups_hourly (hour, priority, customer_tier, sla, alerts, breaches)
+    SELECT date_trunc('hour', a.created_at), t.priority, t.customer_tier, coalesce(a.sla, ''),
+           count(*) FILTER (WHERE a.event = 'alert'),
+           count(*) FILTER (WHERE a.event = 'breach')
+    FROM alerts a JOIN tickets t ON t.id = a.ticket_id
+    WHERE a.created_at >= :since
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (hour, priority, customer_tier, sla) DO UPDATE
+    SET alerts = EXCLUDED.alerts, breaches = EXCLUDED.breaches
+""")
+
+def rollup_alerts(db, now=None):
+    """
+    Refresh hourly alert/breach counts per priority/tier from the newest rolled-up
+    hour onwards (it may have been partial). Caller commits.
+    """
+    since = db.execute(text("SELECT max(hour) FROM sla_rollups_hourly")).scalar()
+    if since is None:
+        since = datetime.min if PARTITION_RETENTION_MONTHS <= 0 else add_months(
+            month_start(now or datetime.utcnow()), -PARTITION_RETENTION_MONTHS
+        )
+    db.execute(ROLLUP, {"since": since})
+    return since
+
+def partition_maintenance(db, now=None):
+    """
+    Roll up, prune the event feed, then drop expired partitions and create
+    upcoming ones. Only one worker
+    does this per round; the rest return False. Caller commits.
+    """
+    if not db.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": PARTITION_LOCK_KEY}).scalar():
+        return False
+    now = now or datetime.utcnow()
+    rollup_alerts(db, now)
+    prune_events(db, now)
+    dropped = drop_expired_partitions(db, now)
+    ensure_partitions(db, now)
+    if dropped:
+        print("Dropped expired partitions", dropped, flush=True)
+    return True
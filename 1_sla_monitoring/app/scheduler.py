@@ -1,56 +1,380 @@
+import asyncio
+import os
+import time
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime, timedelta
-from app.db import SessionLocal
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import or_, and_, select, text
+from app.db import SessionLocal, AsyncSessionLocal
 from app.models import Ticket, TicketHistory, Alert
 from app.config import config
-from app.slack import send_alert
+from app.slack import enqueue_alert, dispatcher
+from app.events import publish
+from app.sla import SLA_NAMES, DEADLINE_COLUMNS, recompute_deadlines
+from app.timers import TimerQueue
+from app.alert_state import alert_states
+from app.leases import leases, backfill_shards, SLA_LEASE_SECONDS
+from app.partitions import ensure_partitions, partition_maintenance, PARTITION_MAINTENANCE_SECONDS
+from app.metrics import TICK_SECONDS, TICK_TICKETS
+
+# 'poll': evaluate due tickets every minute; 'timer': fire each SLA event on time
+SLA_ENGINE = os.getenv("SLA_ENGINE", "poll")
+# timer engine only holds events due within this horizon; the rest are refilled from the DB
+TIMER_HORIZON_SECONDS = int(os.getenv("TIMER_HORIZON_SECONDS", "3600"))
+# tickets evaluated per transaction within a tick
+TICK_BATCH_SIZE = int(os.getenv("TICK_BATCH_SIZE", "500"))
+# ingested_at is stamped before the ingest commits; ticks look back this much further
+# for fresh ingests, so one still uncommitted when a tick ran is caught by the next
+INGEST_LAG_SECONDS = float(os.getenv("INGEST_LAG_SECONDS", "300"))
+# timer engine: backoff cap after failed loads or firings
+TIMER_RETRY_MAX_SECONDS = 60
 
 scheduler = AsyncIOScheduler()
 
-async def check_sla():
-    db = SessionLocal()
-    now = datetime.utcnow()
-    tickets = db.query(Ticket).filter(Ticket.status=='open').all()
+# upper bound of the window evaluated by the previous tick
+last_tick = None
+
+def due_filter(since, now):
+    """
+    Open tickets with an SLA event in (since, now]: an alert threshold crossed, a
+    deadline passed, or a fresh ingest that may already sit inside its window.
+    Ingests are looked for back to `since - INGEST_LAG_SECONDS`, so some are
+    re-selected for a few ticks; alert_states makes the repeats no-ops.
+    """
+    lagged = None if since is None else since - timedelta(seconds=INGEST_LAG_SECONDS)
+    clauses = []
+    for name in SLA_NAMES:
+        alert_at = getattr(Ticket, f"{name}_alert_at")
+        due_at = getattr(Ticket, f"{name}_due_at")
+        if since is None:
+            clauses.append(due_at <= now)
+            clauses.append(alert_at <= now)
+        else:
+            # windowed like the alert threshold: a ticket that stays open past a
+            # deadline it already breached must not be re-selected every tick
+            clauses.append(and_(due_at > since, due_at <= now))
+            clauses.append(and_(alert_at > since, alert_at <= now))
+            # alert_at <= due_at, so this also catches re-ingests already past due
+            clauses.append(and_(Ticket.ingested_at > lagged, alert_at <= now))
+    return and_(Ticket.status == 'open', or_(*clauses))
+
+async def evaluate_tickets(db, tickets, now, sla_names=None):
+    """
+    Record and enqueue the alerts/breaches due for `tickets`. `sla_names` optionally
+    maps ticket id -> SLA names to look at (default: all).
+    """
+    candidates = []
     for ticket in tickets:
-        sla_items = config.get(ticket.priority, ticket.customer_tier)
-        for sla_name, sla_seconds in sla_items.items():
-            deadline = ticket.created_at + timedelta(seconds=sla_seconds)
+        for sla_name in SLA_NAMES:
+            if sla_names is not None and sla_name not in sla_names[ticket.id]:
+                continue
+            deadline = getattr(ticket, f"{sla_name}_due_at")
+            if deadline is None:
+                continue
             remaining = (deadline - now).total_seconds()
-            # Breach
-            if remaining <= 0 and ticket.status != 'breached':
-                # record history
-                db.add(TicketHistory(
-                    ticket_id=ticket.id,
-                    old_status=ticket.status,
-                    new_status='breached',
-                    changed_at=now
-                ))
-                # record alert
-                db.add(Alert(
-                    ticket_id=ticket.id,
-                    event='breach',
-                    sla=sla_name,
-                    remaining=int(remaining),
-                    created_at=now
-                ))
-                ticket.escalation_level += 1
-                ticket.status = 'breached'
-                await send_alert({"id": ticket.id, "event": "breach", "sla": sla_name})
-            # Alert threshold
-            elif remaining / sla_seconds <= 0.15:
-                # record alert
-                db.add(Alert(
-                    ticket_id=ticket.id,
-                    event='alert',
-                    sla=sla_name,
-                    remaining=int(remaining),
-                    created_at=now
-                ))
-                await send_alert({"id": ticket.id, "event": "alert", "sla": sla_name, "remaining": remaining})
-    db.commit()
-    db.close()
+            if remaining <= 0:
+                candidates.append((ticket, sla_name, 'breached', remaining))
+            elif now >= getattr(ticket, f"{sla_name}_alert_at"):
+                candidates.append((ticket, sla_name, 'warned', remaining))
+    won = await alert_states.advance(db, [(t.id, s, state) for t, s, state, _ in candidates], now)
+    for ticket, sla_name, state, remaining in candidates:
+        if (ticket.id, sla_name) not in won:
+            continue
+        # Breach
+        if state == 'breached':
+            if ticket.status == 'breached':
+                continue
+            # record history
+            db.add(TicketHistory(
+                ticket_id=ticket.id,
+                old_status=ticket.status,
+                new_status='breached',
+                changed_at=now
+            ))
+            # record alert
+            db.add(Alert(
+                ticket_id=ticket.id,
+                event='breach',
+                sla=sla_name,
+                remaining=int(remaining),
+                created_at=now
+            ))
+            publish(db, "status", ticket.id, {"old_status": ticket.status, "new_status": "breached"}, now)
+            ticket.escalation_level += 1
+            ticket.status = 'breached'
+            enqueue_alert(db, {"id": ticket.id, "event": "breach", "sla": sla_name})
+            publish(db, "breach", ticket.id, {"sla": sla_name, "remaining": int(remaining)}, now)
+        # Alert threshold
+        else:
+            # record alert
+            db.add(Alert(
+                ticket_id=ticket.id,
+                event='alert',
+                sla=sla_name,
+                remaining=int(remaining),
+                created_at=now
+            ))
+            enqueue_alert(db, {"id": ticket.id, "event": "alert", "sla": sla_name, "remaining": remaining})
+            publish(db, "alert", ticket.id, {"sla": sla_name, "remaining": int(remaining)}, now)
+
+async def evaluate_ids(ids, now, sla_names=None):
+    """Evaluate the still-open tickets among `ids` in one short transaction."""
+    async with AsyncSessionLocal() as db:
+        try:
+            tickets = (await db.execute(
+                select(Ticket).where(Ticket.id.in_(ids), Ticket.status == 'open')
+                # lock in id order, like ingest, so a concurrent upsert cannot deadlock with us
+                .order_by(Ticket.id).with_for_update()
+            )).scalars().all()
+            await evaluate_tickets(db, tickets, now, sla_names)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            alert_states.clear()
+            raise
+    dispatcher.wake()
+
+async def check_sla():
+    """One poll tick over the owned partitions; returns the number of tickets evaluated."""
+    global last_tick
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    # newly acquired partitions were not watched over the last window: scan them whole
+    catch_up = leases.take_acquired()
+    steady = leases.owned - catch_up
+    ids = []
+    async with AsyncSessionLocal() as db:
+        for shards, since in ((steady, last_tick), (catch_up, None)):
+            if shards:
+                ids += (await db.execute(
+                    select(Ticket.id).where(Ticket.shard.in_(sorted(shards)), due_filter(since, now))
+                )).scalars().all()
+    # per-batch transactions keep row locks and stretches between awaits short
+    for i in range(0, len(ids), TICK_BATCH_SIZE):
+        await evaluate_ids(ids[i:i + TICK_BATCH_SIZE], now)
+    last_tick = now
+    TICK_SECONDS.observe(time.perf_counter() - started)
+    TICK_TICKETS.observe(len(ids))
+    return len(ids)
+
+def refresh_deadlines(policy, shards=None, pairs=None):
+    db = SessionLocal()
+    try:
+        rows = recompute_deadlines(db, policy, shards, pairs)
+        db.commit()
+        return rows
+    finally:
+        db.close()
+
+def apply_policy_change(policy, previous):
+    """
+    Config reload listener. Every worker sees the reload; each rewrites deadlines
+    only for its own partitions and only for the (priority, tier) pairs whose
+    rules changed, then re-arms just those tickets' timers. The poll engine needs
+    nothing here: the rewrite marks the tickets ingested, so the next tick
+    evaluates deadlines that moved behind its window.
+    """
+    owned = leases.owned
+    if not owned:
+        return
+    pairs = policy.changed_pairs(previous)
+    if pairs is not None and not pairs:
+        return
+    rows = refresh_deadlines(policy, owned, pairs)
+    if timer_engine.running:
+        if rows is None:
+            timer_engine.invalidate()
+        else:
+            timer_engine.schedule_rows_threadsafe(rows)
+
+# arbitrary key for pg_try_advisory_xact_lock
+STARTUP_LOCK_KEY = 0x51A
+
+def startup_maintenance():
+    """
+    Bring every ticket's shard and deadlines up to date with the current config.
+    Runs in whichever worker gets the advisory lock first; the others skip it.
+    """
+    db = SessionLocal()
+    try:
+        # every worker needs this month's partitions before it can write history or alerts
+        ensure_partitions(db)
+        db.commit()
+        if db.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": STARTUP_LOCK_KEY}).scalar():
+            backfill_shards(db)
+            recompute_deadlines(db, config.policy)
+        db.commit()
+    finally:
+        db.close()
+
+def run_partition_maintenance():
+    db = SessionLocal()
+    try:
+        partition_maintenance(db)
+        db.commit()
+    except Exception as e:
+        print("Partition maintenance failed", e, flush=True)
+    finally:
+        db.close()
+
+async def rebalance_partitions():
+    async with AsyncSessionLocal() as db:
+        changed = await leases.rebalance(db)
+    if changed and timer_engine.running:
+        timer_engine.invalidate()
+
+async def release_partitions():
+    async with AsyncSessionLocal() as db:
+        await leases.release(db)
+
+def epoch(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+class TimerEngine:
+    """
+    Fires each ticket's alert threshold and deadline at the moment it passes instead
+    of on the next poll. Timers are keyed (ticket_id, column index into
+    DEADLINE_COLUMNS); only events due before `loaded_until` are held in memory and
+    the window is slid forward from the deadline indexes every half horizon.
+
+    Failures back off exponentially up to TIMER_RETRY_MAX_SECONDS instead of ending
+    the task: a failed load marks the engine stale, so it reloads everything due
+    (past deadlines included) once the database answers again, and timers whose
+    firing failed are put back to fire again after the delay.
+    """
+    def __init__(self, horizon=TIMER_HORIZON_SECONDS):
+        self.horizon = horizon
+        self.queue = TimerQueue()
+        self.loaded_until = None
+        self.task = None
+        self.loop = None
+        self._stale = False
+        self._wake = asyncio.Event()
+
+    @property
+    def running(self):
+        return self.task is not None
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.task = self.loop.create_task(self._run())
+
+    def invalidate(self):
+        """Drop every timer and reload from the DB; safe to call from any thread."""
+        self._stale = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._wake.set)
+
+    def schedule_rows_threadsafe(self, rows):
+        self.loop.call_soon_threadsafe(self.schedule_rows, rows)
+
+    def schedule_rows(self, rows):
+        """(Re)arm timers for freshly ingested ticket dicts carrying deadline columns."""
+        if self.loaded_until is None:
+            return
+        for row in rows:
+            owned = row["shard"] in leases.owned
+            for i, col in enumerate(DEADLINE_COLUMNS):
+                key = (row["id"], i)
+                when = row.get(col)
+                if not owned or row["status"] != 'open' or when is None or epoch(when) > self.loaded_until:
+                    self.queue.cancel(key)
+                else:
+                    self.queue.schedule(key, epoch(when))
+        self._wake.set()
+
+    async def _load(self, since, until):
+        # `until` is epoch seconds; deadline columns are naive UTC
+        hi = datetime.utcfromtimestamp(until)
+        lo = None if since is None else datetime.utcfromtimestamp(since)
+        clauses = []
+        for col in DEADLINE_COLUMNS:
+            column = getattr(Ticket, col)
+            clauses.append(column <= hi if lo is None else and_(column > lo, column <= hi))
+        stmt = (
+            select(Ticket.id, *[getattr(Ticket, c) for c in DEADLINE_COLUMNS])
+            .where(Ticket.status == 'open', Ticket.shard.in_(sorted(leases.owned)), or_(*clauses))
+            .execution_options(yield_per=10_000)
+        )
+        async with AsyncSessionLocal() as db:
+            async for row in await db.stream(stmt):
+                for i, when in enumerate(row[1:]):
+                    if when is not None and (lo is None or when > lo) and when <= hi:
+                        self.queue.schedule((row.id, i), epoch(when))
+        self.loaded_until = until
+
+    async def _fire(self, keys):
+        by_ticket = {}
+        for ticket_id, i in keys:
+            # partitions handed over since the timer was armed belong to another worker now
+            if not leases.owns(ticket_id):
+                continue
+            by_ticket.setdefault(ticket_id, set()).add(DEADLINE_COLUMNS[i].split("_")[0])
+        # a backlog (startup, takeover) goes out in short transactions, as in check_sla
+        ids = sorted(by_ticket)
+        for i in range(0, len(ids), TICK_BATCH_SIZE):
+            await evaluate_ids(ids[i:i + TICK_BATCH_SIZE], datetime.utcnow(), by_ticket)
+
+    async def _run(self):
+        self._stale = True
+        load_failures = fire_failures = 0
+        while True:
+            now = time.time()
+            try:
+                if self._stale:
+                    self._stale = False
+                    self.queue = TimerQueue()
+                    await self._load(None, now + self.horizon)
+                elif now + self.horizon / 2 >= self.loaded_until:
+                    await self._load(self.loaded_until, now + self.horizon)
+                load_failures = 0
+            except Exception as e:
+                # a partial refill would leave a gap: start over from the database
+                self._stale = True
+                load_failures += 1
+                delay = min(TIMER_RETRY_MAX_SECONDS, 2 ** load_failures)
+                print(f"SLA timer load failed, retrying in {delay}s", e, flush=True)
+                await asyncio.sleep(delay)
+                continue
+            due = self.queue.pop_due(now)
+            if due:
+                try:
+                    await self._fire(due)
+                    fire_failures = 0
+                except Exception as e:
+                    fire_failures += 1
+                    delay = min(TIMER_RETRY_MAX_SECONDS, 2 ** fire_failures)
+                    print(f"SLA timer firing failed, retrying {len(due)} in {delay}s", e, flush=True)
+                    # alert_states dedupes whatever the failed attempt did commit
+                    for key in due:
+                        if key not in self.queue:
+                            self.queue.schedule(key, now + delay)
+                continue
+            wake_at = self.loaded_until - self.horizon / 2
+            nxt = self.queue.next_deadline()
+            if nxt is not None:
+                wake_at = min(wake_at, nxt)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, wake_at - time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+timer_engine = TimerEngine()
 
 
 def start_scheduler():
-    scheduler.add_job(check_sla, 'interval', seconds=60)
-    scheduler.start()
\ No newline at end of file
+    dispatcher.start()
+    config.subscribe(apply_policy_change)
+    scheduler.add_job(
+        rebalance_partitions, 'interval', seconds=max(1, SLA_LEASE_SECONDS // 3),
+        next_run_time=datetime.now(),
+    )
+    # sync job: APScheduler runs it in a worker thread
+    scheduler.add_job(run_partition_maintenance, 'interval', seconds=PARTITION_MAINTENANCE_SECONDS)
+    if SLA_ENGINE == "timer":
+        timer_engine.start()
+    else:
+        scheduler.add_job(check_sla, 'interval', seconds=60)
+    scheduler.start()
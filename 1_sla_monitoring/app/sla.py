@@ -0,0 +1,64 @@
+from datetime import datetime
+from sqlalchemy import update, tuple_
+from app.config import SLA_NAMES
+from app.models import Ticket
+
+DEADLINE_COLUMNS = tuple(
+    f"{name}_{kind}_at" for name in SLA_NAMES for kind in ("alert", "due")
+)
+
+def deadline_columns(rules, created_at):
+    """
+    Precomputed `<sla>_alert_at` / `<sla>_due_at` values for a ticket created at
+    `created_at` under `rules` ({sla_name: SLARule}, see SLAPolicy.lookup).
+    """
+    cols = dict.fromkeys(DEADLINE_COLUMNS)
+    for name, rule in rules.items():
+        cols[f"{name}_alert_at"] = created_at + rule.alert
+        cols[f"{name}_due_at"] = created_at + rule.due
+    return cols
+
+def _pair_values(rules, now):
+    # counts as a fresh ingest, so the poll engine's next tick evaluates deadlines
+    # that moved behind its window
+    values = {"ingested_at": now}
+    for name in SLA_NAMES:
+        rule = rules.get(name)
+        values[f"{name}_alert_at"] = None if rule is None else Ticket.created_at + rule.alert
+        values[f"{name}_due_at"] = None if rule is None else Ticket.created_at + rule.due
+    return values
+
+RETURNED = (Ticket.id, Ticket.status, Ticket.shard, *[getattr(Ticket, c) for c in DEADLINE_COLUMNS])
+
+def recompute_deadlines(db, policy, shards=None, pairs=None):
+    """
+    Rewrite the deadline columns from `policy` (an SLAPolicy) for every ticket, or
+    only those in `shards` and/or with a (priority, tier) in `pairs`; one UPDATE
+    per pair. Caller commits. With `pairs`, returns the rewritten open tickets as
+    dicts so in-memory timers can be re-armed. Rewritten tickets get `ingested_at`
+    set to now, which the poll engine's due_filter picks up.
+    """
+    now = datetime.utcnow()
+    scope = [] if shards is None else [Ticket.shard.in_(sorted(shards))]
+    if pairs is not None:
+        touched = []
+        for priority, tier in sorted(pairs):
+            rows = db.execute(
+                update(Ticket)
+                .where(Ticket.priority == priority, Ticket.customer_tier == tier, *scope)
+                .values(_pair_values(policy.lookup(priority, tier), now))
+                .returning(*RETURNED)
+            ).mappings()
+            touched += [dict(r) for r in rows if r["status"] == 'open']
+        return touched
+    for (priority, tier), rules in policy.rules.items():
+        db.execute(
+            update(Ticket)
+            .where(Ticket.priority == priority, Ticket.customer_tier == tier, *scope)
+            .values(_pair_values(rules, now))
+        )
+    # tickets whose (priority, tier) is no longer configured have no SLA
+    stale = update(Ticket).where(*scope).values(dict.fromkeys(DEADLINE_COLUMNS))
+    if policy.rules:
+        stale = stale.where(tuple_(Ticket.priority, Ticket.customer_tier).not_in(list(policy.rules)))
+    db.execute(stale)
@@ -1,14 +1,248 @@
+import asyncio
+import logging
 import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, tuple_
+from app.db import AsyncSessionLocal
+from app.models import AlertOutbox
+from app.metrics import DISPATCH_SECONDS, WEBHOOK_POST_SECONDS
+
+logger = logging.getLogger(__name__)
 
-# Simple print-based alert logging (replaced Slack with print)
 SLACK_WEBHOOK = os.getenv("SLACK_WEBHOOK_URL", "")
-async def send_alert(payload: dict):
+# bounded in-memory hand-off between the outbox and the senders
+ALERT_QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", "1000"))
+# concurrent webhook posts (and pooled connections)
+ALERT_CONCURRENCY = int(os.getenv("ALERT_CONCURRENCY", "4"))
+# coalesce up to this many alerts, waiting at most this long, into one message
+ALERT_DIGEST_SIZE = int(os.getenv("ALERT_DIGEST_SIZE", "50"))
+ALERT_DIGEST_WINDOW = float(os.getenv("ALERT_DIGEST_WINDOW", "1.0"))
+# posts per claim, and claims per row before it is marked failed
+ALERT_MAX_RETRIES = int(os.getenv("ALERT_MAX_RETRIES", "5"))
+ALERT_MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", "10"))
+ALERT_BACKOFF_SECONDS = float(os.getenv("ALERT_BACKOFF_SECONDS", "0.5"))
+ALERT_POST_TIMEOUT = float(os.getenv("ALERT_POST_TIMEOUT", "10"))
+# a claimed row is retried by any process once this lease runs out; it is renewed
+# before every post, so it only has to outlast one post and the backoff before it
+ALERT_CLAIM_SECONDS = max(
+    int(os.getenv("ALERT_CLAIM_SECONDS", "60")),
+    int(2 * (ALERT_POST_TIMEOUT + ALERT_BACKOFF_SECONDS * 2 ** max(ALERT_MAX_RETRIES - 2, 0))) + 1,
+)
+ALERT_SWEEP_SECONDS = float(os.getenv("ALERT_SWEEP_SECONDS", "5"))
+
+def enqueue_alert(db, payload: dict):
+    """Stage `payload` for delivery in the caller's transaction."""
     print("ALERT", payload, flush=True)
     if not SLACK_WEBHOOK:
         return
-    import httpx
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(SLACK_WEBHOOK, json=payload)
-        except Exception as e:
-            print("Slack send failed", e, flush=True)
\ No newline at end of file
+    now = datetime.utcnow()
+    db.add(AlertOutbox(payload=payload, created_at=now, next_attempt_at=now, attempts=0))
+
+def digest(payloads):
+    if len(payloads) == 1:
+        return payloads[0]
+    return {"event": "digest", "count": len(payloads), "alerts": payloads}
+
+class AlertDispatcher:
+    """
+    Drains `alert_outbox` to the webhook without ever blocking SLA evaluation.
+
+    A feeder claims unsent rows (FOR UPDATE SKIP LOCKED, leased for
+    ALERT_CLAIM_SECONDS) into a bounded queue whenever it is woken or every
+    ALERT_SWEEP_SECONDS; ALERT_CONCURRENCY senders coalesce queued alerts into
+    digests, post them over one pooled client with exponential backoff and mark
+    the rows sent. Anything not marked sent, including after a crash, is picked up
+    again once its lease expires.
+
+    Each claim bumps `attempts`, which doubles as a fencing token: the lease is
+    renewed before every post and rows are marked sent only while `attempts` still
+    matches, so a row whose lease lapsed and was re-claimed elsewhere is dropped
+    here instead of posted twice. A row is marked failed (`failed_at`) once a
+    webhook rejects it with a 4xx other than 429, which is not retried, or after
+    ALERT_MAX_ATTEMPTS claims.
+    """
+    def __init__(self, url=SLACK_WEBHOOK, concurrency=ALERT_CONCURRENCY,
+                 queue_size=ALERT_QUEUE_SIZE, digest_size=ALERT_DIGEST_SIZE,
+                 digest_window=ALERT_DIGEST_WINDOW):
+        self.url = url
+        self.concurrency = concurrency
+        self.digest_size = digest_size
+        self.digest_window = digest_window
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.client = None
+        self.tasks = []
+        self._wake = asyncio.Event()
+        self.sent = 0
+        self.failed = 0
+        self.posts = 0
+
+    def start(self):
+        if not self.url:
+            return
+        import httpx
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.concurrency),
+            timeout=ALERT_POST_TIMEOUT,
+        )
+        loop = asyncio.get_running_loop()
+        self.tasks = [loop.create_task(self._feed())]
+        self.tasks += [loop.create_task(self._send_loop()) for _ in range(self.concurrency)]
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def wake(self):
+        """New outbox rows were committed."""
+        self._wake.set()
+
+    async def _claim(self, limit):
+        async with AsyncSessionLocal() as db:
+            now = datetime.utcnow()
+            pending = (
+                select(AlertOutbox.id)
+                .where(
+                    AlertOutbox.sent_at.is_(None),
+                    AlertOutbox.failed_at.is_(None),
+                    AlertOutbox.next_attempt_at <= now,
+                )
+                .order_by(AlertOutbox.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            rows = (await db.execute(
+                update(AlertOutbox)
+                .where(AlertOutbox.id.in_(pending.scalar_subquery()))
+                .values(
+                    next_attempt_at=now + timedelta(seconds=ALERT_CLAIM_SECONDS),
+                    attempts=AlertOutbox.attempts + 1,
+                )
+                .returning(AlertOutbox.id, AlertOutbox.payload, AlertOutbox.created_at, AlertOutbox.attempts)
+            )).all()
+            await db.commit()
+            return sorted(rows)
+
+    async def _update_held(self, claims, **values):
+        """
+        Apply `values` to the (id, attempts) `claims` this process still holds;
+        returns the ids updated.
+        """
+        async with AsyncSessionLocal() as db:
+            ids = (await db.execute(
+                update(AlertOutbox)
+                .where(
+                    tuple_(AlertOutbox.id, AlertOutbox.attempts).in_(claims),
+                    AlertOutbox.sent_at.is_(None),
+                    AlertOutbox.failed_at.is_(None),
+                )
+                .values(**values)
+                .returning(AlertOutbox.id)
+            )).scalars().all()
+            await db.commit()
+            return set(ids)
+
+    async def _renew(self, claims):
+        return await self._update_held(
+            claims, next_attempt_at=datetime.utcnow() + timedelta(seconds=ALERT_CLAIM_SECONDS))
+
+    async def _mark_sent(self, claims):
+        return await self._update_held(claims, sent_at=datetime.utcnow())
+
+    async def _mark_failed(self, claims):
+        return await self._update_held(claims, failed_at=datetime.utcnow())
+
+    async def _feed(self):
+        while True:
+            free = self.queue.maxsize - self.queue.qsize()
+            if free > 0:
+                try:
+                    for row in await self._claim(free):
+                        self.queue.put_nowait((row.id, row.attempts, row.payload, row.created_at))
+                except Exception:
+                    logger.exception("Alert outbox claim failed")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), ALERT_SWEEP_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.digest_window
+        while len(batch) < self.digest_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _post_with_retries(self, batch):
+        """
+        Post `batch` as one digest: "sent", "rejected" (a 4xx other than 429),
+        "failed" (retries exhausted) or "lost" (the claim went to another process).
+        """
+        for attempt in range(ALERT_MAX_RETRIES):
+            if attempt:
+                await asyncio.sleep(ALERT_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            held = await self._renew([(i, token) for i, token, _, _ in batch])
+            batch = [row for row in batch if row[0] in held]
+            if not batch:
+                return "lost", batch
+            self.posts += 1
+            try:
+                resp = await self.client.post(self.url, json=digest([p for _, _, p, _ in batch]))
+            except Exception as e:
+                logger.warning("Slack send failed (attempt %d): %r", attempt + 1, e)
+                continue
+            if resp.is_success:
+                return "sent", batch
+            logger.warning("Slack send failed (attempt %d): HTTP %d", attempt + 1, resp.status_code)
+            if 400 <= resp.status_code < 500 and resp.status_code != 429:
+                return "rejected", batch
+        return "failed", batch
+
+    async def _send_loop(self):
+        while True:
+            batch = await self._next_batch()
+            if self.queue.qsize() < self.queue.maxsize // 2:
+                self._wake.set()
+            try:
+                with WEBHOOK_POST_SECONDS.time():
+                    outcome, batch = await self._post_with_retries(batch)
+                claims = [(i, token) for i, token, _, _ in batch]
+                if outcome == "sent":
+                    sent = await self._mark_sent(claims)
+                    self.sent += len(sent)
+                    now = datetime.utcnow()
+                    for _, _, _, created_at in batch:
+                        DISPATCH_SECONDS.observe((now - created_at).total_seconds())
+                elif outcome == "rejected":
+                    failed = await self._mark_failed(claims)
+                    self.failed += len(failed)
+                    logger.error("Webhook rejected %d alert(s); marked failed", len(batch))
+                elif outcome == "failed":
+                    # give up on rows out of attempts; the rest are reclaimed when their lease expires
+                    spent = [c for c in claims if c[1] >= ALERT_MAX_ATTEMPTS]
+                    if spent:
+                        failed = await self._mark_failed(spent)
+                        self.failed += len(failed)
+                        logger.error("%d alert(s) undelivered after %d attempts; marked failed",
+                                     len(spent), ALERT_MAX_ATTEMPTS)
+            except Exception:
+                logger.exception("Alert outbox update failed")
+
+dispatcher = AlertDispatcher()
@@ -2,9 +2,9 @@ import streamlit as st
 import pandas as pd
 import datetime
 import requests
-from sqlalchemy import create_engine
 import os
-from app.config import config
+
+API_URL = os.getenv("API_URL", "http://localhost:8000")
 
 # Page config
 st.set_page_config(page_title="SLA Dashboard", layout="wide")
@@ -28,55 +28,65 @@ if st.sidebar.button("Submit Ticket"):
         "status": status_input
     }]
     try:
-        resp = requests.post("http://localhost:8000/tickets", json=payload)
+        resp = requests.post(f"{API_URL}/tickets", json=payload)
         st.sidebar.success(f"Ingested: {resp.json().get('ingested')} tickets")
     except Exception as e:
         st.sidebar.error(f"Failed to submit: {e}")
 
-# Connect to DB
-DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:password@db:5432/sla_monitoring")
-engine = create_engine(DATABASE_URL)
-
-# Load data with parse_dates
-tickets_df = pd.read_sql("SELECT * FROM tickets", engine, parse_dates=["created_at","updated_at"])
-history_df = pd.read_sql("SELECT * FROM ticket_history ORDER BY changed_at DESC", engine, parse_dates=["changed_at"])
-
-# Compute remaining_response dynamically from config
-def compute_remaining_response(row):
-    sla_cfg = config.get(row['priority'], row['customer_tier'])
-    resp_seconds = sla_cfg.get('response', 0)
-    now = datetime.datetime.utcnow()
-    return (row['created_at'] + pd.to_timedelta(resp_seconds, unit='s') - now).total_seconds()
+# Everything below comes from the API's aggregated, cached /dashboard endpoint
+st.sidebar.header("Filters")
+status_filter = st.sidebar.selectbox("Status", ["", "open", "closed"], index=0, key="f_status")
+priority_filter = st.sidebar.selectbox("Priority", ["", "low", "high"], index=0, key="f_priority")
+tier_filter = st.sidebar.selectbox("Customer Tier", ["", "silver", "gold"], index=0, key="f_tier")
+state_filter = st.sidebar.selectbox("Show", ["alerting", "breached", "all"], index=0)
+page_size = st.sidebar.number_input("Page size", min_value=10, max_value=500, value=100, step=10)
+page = st.sidebar.number_input("Ticket page", min_value=0, value=0, step=1)
+history_page = st.sidebar.number_input("History page", min_value=0, value=0, step=1)
 
-tickets_df['remaining_response'] = tickets_df.apply(compute_remaining_response, axis=1)
+params = {
+    "status": status_filter or None,
+    "priority": priority_filter or None,
+    "tier": tier_filter or None,
+    "state": state_filter,
+    "page": page,
+    "page_size": page_size,
+    "history_page": history_page,
+    "history_page_size": page_size,
+}
+try:
+    resp = requests.get(f"{API_URL}/dashboard", params={k: v for k, v in params.items() if v is not None}, timeout=30)
+    resp.raise_for_status()
+    data = resp.json()
+except Exception as e:
+    st.error(f"Failed to load dashboard: {e}")
+    st.stop()
 
-# Compute flags
-tickets_df['alert'] = tickets_df.apply(
-    lambda r: r['remaining_response'] <= 0.15 * config.get(r['priority'], r['customer_tier']).get('response', 1),
-    axis=1
-)
-tickets_df['breach'] = tickets_df['remaining_response'] <= 0
+# Counts
+totals = data["counts"]["total"]
+c1, c2, c3 = st.columns(3)
+c1.metric("Tickets", totals["tickets"])
+c2.metric("Alerting", totals["alerting"])
+c3.metric("Breached", totals["breached"])
+st.dataframe(pd.DataFrame(data["counts"]["groups"]))
 
-# Alerts pane
-st.subheader("Current Alerts")
-alerts = tickets_df[tickets_df['alert']]
-if not alerts.empty:
-    styled = alerts[['id','priority','customer_tier','remaining_response','breach']].style
-    styled = styled.applymap(lambda v: 'background-color: red' if v else '', subset=['breach'])
-    st.dataframe(styled)
-else:
-    st.write("No alerts at this time.")
-
-# Current Tickets with color coding
-st.subheader("Current Tickets")
+# Tickets with color coding
+tickets = data["tickets"]
+st.subheader(f"Tickets ({state_filter}): {tickets['total']} total, page {tickets['page']}")
+tickets_df = pd.DataFrame(tickets["items"])
 def highlight(row):
     if row['breach']:
         return ['background-color: lightcoral']*len(row)
     if row['alert']:
         return ['background-color: khaki']*len(row)
     return ['']*len(row)
-st.dataframe(tickets_df.style.apply(highlight, axis=1))
+if not tickets_df.empty:
+    st.dataframe(tickets_df.style.apply(highlight, axis=1))
+else:
+    st.write("No tickets match.")
 
 # Status Change History
 st.subheader("Status Change History")
-st.dataframe(history_df)
+history = data["history"]
+st.dataframe(pd.DataFrame(history["items"]))
+if history["has_more"]:
+    st.caption("More history on the next page.")
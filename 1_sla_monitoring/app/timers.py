@@ -0,0 +1,58 @@
+import heapq
+import itertools
+
+class TimerQueue:
+    """
+    Min-heap of (when, seq, key) timers with lazy cancellation.
+
+    Rescheduling or cancelling a key only updates `_live`; superseded heap entries
+    are skipped when they surface and purged in bulk once they outnumber live ones.
+    """
+    COMPACT_MIN = 1024
+
+    def __init__(self):
+        self._heap = []
+        self._live = {}  # key -> seq of its current heap entry
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._live)
+
+    def __contains__(self, key):
+        return key in self._live
+
+    def schedule(self, key, when):
+        seq = next(self._seq)
+        self._live[key] = seq
+        heapq.heappush(self._heap, (when, seq, key))
+        self._maybe_compact()
+
+    def cancel(self, key):
+        if self._live.pop(key, None) is not None:
+            self._maybe_compact()
+
+    def next_deadline(self):
+        self._drop_stale_head()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Remove and return the keys of every live timer with `when <= now`."""
+        due = []
+        heap, live = self._heap, self._live
+        while heap and heap[0][0] <= now:
+            _, seq, key = heapq.heappop(heap)
+            if live.get(key) == seq:
+                del live[key]
+                due.append(key)
+        return due
+
+    def _drop_stale_head(self):
+        heap, live = self._heap, self._live
+        while heap and live.get(heap[0][2]) != heap[0][1]:
+            heapq.heappop(heap)
+
+    def _maybe_compact(self):
+        if len(self._heap) > max(self.COMPACT_MIN, 2 * len(self._live)):
+            live = self._live
+            self._heap = [e for e in self._heap if live.get(e[2]) == e[1]]
+            heapq.heapify(self._heap)
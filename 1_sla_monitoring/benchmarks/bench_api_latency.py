@@ -0,0 +1,81 @@
+"""
+p50/p99 latency of POST /tickets with and without a scheduler tick running in the
+same event loop. The app is driven in-process over ASGI (no startup hooks, so no
+background scheduler); the tick is made heavy by seeding tickets that all sit
+inside their warning window. Needs a disposable Postgres at DATABASE_URL.
+
+    python -m benchmarks.bench_api_latency [seed_tickets]
+"""
+import asyncio
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+import app.scheduler as sched
+from app.db import AsyncSessionLocal, engine
+from app.ingest import upsert_tickets
+from app.main import app
+from benchmarks.common import synthetic_tickets, reset_tables, claim_all_partitions
+
+CONCURRENCY = 16
+BATCH = 10
+IDLE_SECONDS = 5
+
+def percentile(samples, p):
+    return statistics.quantiles(samples, n=100)[p - 1] if len(samples) > 1 else samples[0]
+
+async def seed(n):
+    rows = synthetic_tickets(n, prefix="seed")
+    # low/silver response alerts at 6120s and breaches at 7200s
+    created = datetime.utcnow() - timedelta(seconds=6500)
+    for r in rows:
+        r.update(priority="low", customer_tier="silver", created_at=created, updated_at=created)
+    async with AsyncSessionLocal() as db:
+        await upsert_tickets(db, rows)
+        await db.commit()
+
+async def load(client, stop, latencies, prefix):
+    i = 0
+    while not stop.is_set():
+        batch = synthetic_tickets(BATCH, prefix=f"{prefix}-{i}", seed=i)
+        for r in batch:
+            r["created_at"] = r["updated_at"] = r["created_at"].isoformat()
+        t0 = time.perf_counter()
+        resp = await client.post("/tickets", json=batch)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        resp.raise_for_status()
+        i += 1
+
+async def phase(client, name, during):
+    stop = asyncio.Event()
+    latencies = []
+    workers = [
+        asyncio.create_task(load(client, stop, latencies, f"{name}-{w}"))
+        for w in range(CONCURRENCY)
+    ]
+    t0 = time.perf_counter()
+    await during()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await asyncio.gather(*workers)
+    return latencies, elapsed
+
+async def main(n=20_000):
+    reset_tables(engine)
+    await claim_all_partitions()
+    await seed(n)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        idle, _ = await phase(client, "idle", lambda: asyncio.sleep(IDLE_SECONDS))
+        sched.last_tick = None
+        busy, tick_s = await phase(client, "busy", sched.check_sla)
+    print(f"tick over {n:,} warning tickets: {tick_s:.2f}s")
+    for name, samples in (("idle", idle), ("during tick", busy)):
+        print(f"{name:>12}: {len(samples):>6} requests  p50 {percentile(samples, 50):8.1f} ms  "
+              f"p99 {percentile(samples, 99):8.1f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000))
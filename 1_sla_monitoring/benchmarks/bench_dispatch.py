@@ -0,0 +1,221 @@
+"""
+Drive AlertDispatcher against a local stub webhook and compare it with the old
+send-one-alert-per-fresh-client loop. The stub adds latency and fails a fraction
+of posts to exercise retries. Needs a disposable Postgres at DATABASE_URL.
+
+With --check, instead asserts delivery guarantees against the stub: every alert
+delivered exactly once by two dispatchers sharing the outbox through 500s, a
+4xx dead-letters without a retry, retries stop at ALERT_MAX_ATTEMPTS, and a
+dispatcher whose claim was taken over neither posts nor marks the rows.
+
+    python -m benchmarks.bench_dispatch [n_alerts]
+    python -m benchmarks.bench_dispatch --check
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import func, select, update
+
+from app import slack
+from app.db import SessionLocal, engine
+from app.models import AlertOutbox
+from app.slack import AlertDispatcher
+from benchmarks.common import reset_tables
+
+LATENCY = 0.02
+FAIL_RATE = 0.05
+
+class StubWebhook:
+    def __init__(self, latency=LATENCY, fail_rate=FAIL_RATE, statuses=None):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        # alert id -> status line returned for any post containing it
+        self.statuses = statuses or {}
+        self.rng = random.Random(0)
+        self.alerts = 0
+        self.posts = 0
+        # per alert id: posts containing it, and posts delivering it
+        self.seen = Counter()
+        self.delivered = Counter()
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/hook"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                body = json.loads(await reader.readexactly(length))
+                await asyncio.sleep(self.latency)
+                self.posts += 1
+                ids = [a.get("id") for a in body.get("alerts", [body])]
+                self.seen.update(ids)
+                forced = [self.statuses[i] for i in ids if i in self.statuses]
+                if forced:
+                    status = forced[0]
+                elif self.rng.random() < self.fail_rate:
+                    status = b"500 Internal Server Error"
+                else:
+                    status = b"200 OK"
+                    self.alerts += len(ids)
+                    self.delivered.update(ids)
+                writer.write(b"HTTP/1.1 " + status + b"\r\ncontent-length: 0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+def seed_outbox(n):
+    reset_tables(engine)
+    now = datetime.utcnow()
+    db = SessionLocal()
+    db.add_all([
+        AlertOutbox(payload={"id": f"t-{i}", "event": "alert", "sla": "response"},
+                    created_at=now, next_attempt_at=now, attempts=0)
+        for i in range(n)
+    ])
+    db.commit()
+    db.close()
+
+def outbox_counts():
+    """{"sent": .., "failed": .., "pending": ..} rows"""
+    with SessionLocal() as db:
+        sent = db.scalar(select(func.count()).where(AlertOutbox.sent_at.isnot(None)))
+        failed = db.scalar(select(func.count()).where(AlertOutbox.failed_at.isnot(None)))
+        total = db.scalar(select(func.count()).select_from(AlertOutbox))
+    return {"sent": sent, "failed": failed, "pending": total - sent - failed}
+
+async def run_dispatcher(n):
+    seed_outbox(n)
+    stub = StubWebhook()
+    url = await stub.start()
+    slack.ALERT_BACKOFF_SECONDS = 0.05
+    d = AlertDispatcher(url=url)
+    t0 = time.perf_counter()
+    d.start()
+    while d.sent < n:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - t0
+    await d.close()
+    await stub.stop()
+    return elapsed, stub
+
+async def run_per_alert(n):
+    # the pre-dispatcher send_alert: fresh client per alert, awaited serially
+    stub = StubWebhook()
+    url = await stub.start()
+    t0 = time.perf_counter()
+    for i in range(n):
+        async with httpx.AsyncClient() as client:
+            try:
+                await client.post(url, json={"id": f"t-{i}", "event": "alert", "sla": "response"})
+            except Exception:
+                pass
+    elapsed = time.perf_counter() - t0
+    await stub.stop()
+    return elapsed, stub
+
+async def drain(dispatchers, stub, done, timeout=60):
+    for d in dispatchers:
+        d.start()
+    t0 = time.perf_counter()
+    while not done() and time.perf_counter() - t0 < timeout:
+        await asyncio.sleep(0.05)
+    for d in dispatchers:
+        await d.close()
+    await stub.stop()
+
+async def check_exactly_once(n=500):
+    # two dispatchers taking turns on one outbox, through 500s and short leases
+    seed_outbox(n)
+    stub = StubWebhook(latency=0.005, fail_rate=0.3)
+    url = await stub.start()
+    dispatchers = [AlertDispatcher(url=url, queue_size=40, digest_size=10, digest_window=0.05) for _ in range(2)]
+    await drain(dispatchers, stub, lambda: outbox_counts()["pending"] == 0)
+    assert outbox_counts() == {"sent": n, "failed": 0, "pending": 0}, outbox_counts()
+    assert set(stub.delivered) == {f"t-{i}" for i in range(n)}, "missing alerts"
+    duplicates = {i: c for i, c in stub.delivered.items() if c > 1}
+    assert not duplicates, f"delivered more than once: {duplicates}"
+    assert sum(stub.seen.values()) > n, "no post failed, so nothing was retried"
+    assert sum(d.sent for d in dispatchers) == n, [d.sent for d in dispatchers]
+    return {"alerts": n, "posts": stub.posts, "by_dispatcher": [d.sent for d in dispatchers]}
+
+async def check_rejected():
+    # a 400 is final: one post, then failed; the other alerts still go out
+    seed_outbox(10)
+    stub = StubWebhook(latency=0, fail_rate=0, statuses={"t-3": b"400 Bad Request"})
+    url = await stub.start()
+    d = AlertDispatcher(url=url, digest_size=1, digest_window=0)
+    await drain([d], stub, lambda: outbox_counts()["pending"] == 0)
+    assert outbox_counts() == {"sent": 9, "failed": 1, "pending": 0}, outbox_counts()
+    assert stub.seen["t-3"] == 1, f"4xx retried: {stub.seen['t-3']} posts"
+    return {"posts": stub.posts}
+
+async def check_max_attempts():
+    # a 429/5xx is retried ALERT_MAX_RETRIES times per claim, for ALERT_MAX_ATTEMPTS claims
+    seed_outbox(3)
+    stub = StubWebhook(latency=0, fail_rate=0, statuses={"t-1": b"429 Too Many Requests"})
+    url = await stub.start()
+    d = AlertDispatcher(url=url, digest_size=1, digest_window=0)
+    await drain([d], stub, lambda: outbox_counts()["pending"] == 0)
+    assert outbox_counts() == {"sent": 2, "failed": 1, "pending": 0}, outbox_counts()
+    expected = slack.ALERT_MAX_RETRIES * slack.ALERT_MAX_ATTEMPTS
+    assert stub.seen["t-1"] == expected, f"{stub.seen['t-1']} posts, expected {expected}"
+    return {"posts": stub.posts}
+
+async def check_lost_claim():
+    # a claim that lapsed and was taken over is neither posted nor marked by its old holder
+    seed_outbox(5)
+    old, new = AlertDispatcher(), AlertDispatcher()
+    stale = [(r.id, r.attempts) for r in await old._claim(5)]
+    with SessionLocal() as db:
+        db.execute(update(AlertOutbox).values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.commit()
+    fresh = [(r.id, r.attempts) for r in await new._claim(5)]
+    assert len(fresh) == 5
+    assert await old._renew(stale) == set() and await old._mark_sent(stale) == set()
+    assert await new._mark_sent(fresh) == {i for i, _ in fresh}
+    assert outbox_counts()["sent"] == 5
+    return {"fenced": len(stale)}
+
+async def check():
+    # short leases and backoff, so lapsed claims and retries happen within seconds
+    slack.ALERT_BACKOFF_SECONDS = 0.01
+    slack.ALERT_CLAIM_SECONDS = 1
+    slack.ALERT_SWEEP_SECONDS = 0.1
+    slack.ALERT_MAX_RETRIES = 2
+    slack.ALERT_MAX_ATTEMPTS = 3
+    # one event loop throughout: the async engine's pooled connections belong to it
+    for name, run in (("exactly_once", check_exactly_once), ("rejected", check_rejected),
+                      ("max_attempts", check_max_attempts), ("lost_claim", check_lost_claim)):
+        print(f"{name:>12}: ok  {json.dumps(await run())}")
+
+def main(n=2000):
+    for name, run in (("per_alert", run_per_alert), ("dispatcher", run_dispatcher)):
+        elapsed, stub = asyncio.run(run(n))
+        print(f"{name:>10}: {n / elapsed:>8.0f} alerts/s  {stub.posts:>6} posts  "
+              f"{stub.alerts:>6} alerts delivered  {elapsed:6.2f}s")
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("n_alerts", type=int, nargs="?", default=2000)
+    p.add_argument("--check", action="store_true", help="assert delivery guarantees instead of timing")
+    args = p.parse_args()
+    asyncio.run(check()) if args.check else main(args.n_alerts)
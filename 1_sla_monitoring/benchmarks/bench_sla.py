@@ -0,0 +1,254 @@
+"""
+End-to-end SLA engine simulation. Seeds a synthetic ticket population, then for
+`--duration` seconds keeps ingesting new tickets (with a share of status churn on
+existing ones) while the poll ticks or the timer engine evaluate SLAs. All SLA
+durations and the poll interval are divided by `--time-scale` so a day of
+deadlines fits in a short run. Prints one JSON document, for tracking regressions:
+
+    tick duration and tickets evaluated per tick (poll engine)
+    ingest throughput (tickets/s) and per-batch latency
+    alert latency: emitted time minus the threshold/deadline it was for
+    policy lookups/s, peak RSS and timer-queue size
+
+Needs a disposable Postgres at DATABASE_URL (tables are dropped and recreated).
+There is no SQLite mode: ingest, partitions and leases rely on Postgres features.
+
+    python -m benchmarks.bench_sla --tickets 50000 --rate 2000 --duration 60 --engine poll
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import app.scheduler as sched
+from app.config import config, SLAPolicy, SLA_NAMES
+from app.db import AsyncSessionLocal, engine
+from app.ingest import prepare_rows, upsert_rows
+from benchmarks.common import reset_tables, claim_all_partitions
+
+POLL_SECONDS = 60
+
+def summary(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {
+        "count": len(samples), "mean": statistics.fmean(samples),
+        "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": samples[-1],
+    }
+
+def weighted(spec):
+    """'high=3,low=1' -> ([values], [weights])"""
+    pairs = [item.split("=") for item in spec.split(",")]
+    return [k for k, _ in pairs], [float(w) for _, w in pairs]
+
+def scaled_policy(scale):
+    data = {
+        priority: {tier: {name: s / scale for name, s in slas.items()} for tier, slas in tiers.items()}
+        for priority, tiers in config.policy.data.items()
+    }
+    return SLAPolicy(data, config.policy.version + 1, f"scaled/{scale}")
+
+class Population:
+    def __init__(self, args, seed=0):
+        self.rng = random.Random(seed)
+        self.priorities = weighted(args.priority_mix)
+        self.tiers = weighted(args.tier_mix)
+        self.max_age = args.max_age / args.time_scale
+        self.ids = []
+        self.next_id = 0
+
+    def new(self, n, age=True):
+        now = datetime.utcnow()
+        rows = []
+        for _ in range(n):
+            created = now - timedelta(seconds=self.rng.uniform(0, self.max_age) if age else 0)
+            rows.append({
+                "id": f"sim-{self.next_id}",
+                "priority": self.rng.choices(*self.priorities)[0],
+                "customer_tier": self.rng.choices(*self.tiers)[0],
+                "created_at": created, "updated_at": created, "status": "open",
+            })
+            self.ids.append(rows[-1]["id"])
+            self.next_id += 1
+        return rows
+
+    def churn(self, n, existing):
+        # re-send existing tickets with a different status
+        picks = self.rng.sample(range(len(self.ids)), min(n, len(self.ids)))
+        rows = []
+        for i in picks:
+            row = existing.get(self.ids[i])
+            if row is not None:
+                status = "closed" if row["status"] == "open" else "open"
+                row = dict(row, status=status, updated_at=datetime.utcnow())
+                existing[row["id"]] = row
+                rows.append(row)
+        return rows
+
+async def ingest(rows):
+    # what POST /tickets does, returning the prepared rows the timer engine is fed
+    now = datetime.utcnow()
+    prepared = prepare_rows(rows, now)
+    async with AsyncSessionLocal() as db:
+        await upsert_rows(db, prepared, now)
+        await db.commit()
+    return prepared
+
+async def ingest_loop(args, pop, existing, stop, stats):
+    interval = args.batch / args.rate
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        fresh = pop.new(args.batch - int(args.batch * args.churn), age=False)
+        for r in fresh:
+            existing[r["id"]] = r
+        rows = fresh + pop.churn(int(args.batch * args.churn), existing)
+        prepared = await ingest(rows)
+        if sched.timer_engine.running:
+            sched.timer_engine.schedule_rows(prepared)
+        elapsed = time.perf_counter() - t0
+        stats["batch_ms"].append(elapsed * 1000)
+        stats["ingested"] += len(rows)
+        stats["ingest_seconds"] += elapsed
+        await asyncio.sleep(max(0.0, interval - elapsed))
+
+async def tick_loop(interval, stop, stats):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        n = await sched.check_sla()
+        stats["tick_ms"].append((time.perf_counter() - t0) * 1000)
+        stats["tick_tickets"].append(n)
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(stop.wait(), max(0.0, interval - (time.perf_counter() - t0)))
+
+async def timer_catch_up(engine):
+    """Wait until the timer engine has fired everything already overdue at start."""
+    while engine.loaded_until is None:
+        await asyncio.sleep(0.01)
+    start = time.time()
+    while (nxt := engine.queue.next_deadline()) is not None and nxt <= start:
+        await asyncio.sleep(0.01)
+
+async def count_alerts():
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(text("SELECT count(*) FROM alerts"))).scalar()
+
+async def alert_latency(since):
+    """Seconds between each alert's threshold/deadline and the alert row, for deadlines inside the run."""
+    per_sla = []
+    for name in SLA_NAMES:
+        per_sla.append(f"""
+            SELECT extract(epoch FROM a.created_at - CASE a.event
+                       WHEN 'alert' THEN t.{name}_alert_at ELSE t.{name}_due_at END)
+            FROM alerts a JOIN tickets t ON t.id = a.ticket_id
+            WHERE a.sla = '{name}' AND CASE a.event
+                       WHEN 'alert' THEN t.{name}_alert_at ELSE t.{name}_due_at END >= :since
+        """)
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(text(" UNION ALL ".join(per_sla)), {"since": since})).scalars().all()
+    return [float(r) for r in rows]
+
+def policy_lookups_per_second(n=200_000):
+    policy = config.policy
+    keys = [(p, t) for p, t in policy.rules] or [("high", "gold")]
+    t0 = time.perf_counter()
+    for i in range(n):
+        policy.lookup(*keys[i % len(keys)])
+    return n / (time.perf_counter() - t0)
+
+async def main(args):
+    reset_tables(engine)
+    await claim_all_partitions()
+    config.policy = scaled_policy(args.time_scale)
+    pop = Population(args)
+    existing = {}
+
+    t0 = time.perf_counter()
+    for lo in range(0, args.tickets, 10_000):
+        rows = pop.new(min(10_000, args.tickets - lo))
+        existing.update((r["id"], r) for r in rows)
+        await ingest(rows)
+    seed_seconds = time.perf_counter() - t0
+
+    # a fresh worker first catches up on everything already overdue
+    t0 = time.perf_counter()
+    if args.engine == "poll":
+        await sched.check_sla()
+    else:
+        sched.timer_engine.start()
+        await timer_catch_up(sched.timer_engine)
+    catch_up = {"ms": (time.perf_counter() - t0) * 1000, "alerts": await count_alerts()}
+
+    stats = {"batch_ms": [], "ingested": 0, "ingest_seconds": 0.0, "tick_ms": [], "tick_tickets": []}
+    stop = asyncio.Event()
+    run_start = datetime.utcnow()
+    tasks = [asyncio.create_task(ingest_loop(args, pop, existing, stop, stats))]
+    if args.engine == "poll":
+        tasks.append(asyncio.create_task(tick_loop(POLL_SECONDS / args.time_scale, stop, stats)))
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    timer_size = None
+    if sched.timer_engine.running:
+        timer_size = len(sched.timer_engine.queue)
+        sched.timer_engine.task.cancel()
+        await asyncio.gather(sched.timer_engine.task, return_exceptions=True)
+
+    latency = await alert_latency(run_start)
+    async with AsyncSessionLocal() as db:
+        alerts = (await db.execute(text("SELECT event, count(*) FROM alerts GROUP BY 1"))).all()
+    return {
+        "params": vars(args),
+        "seed": {"tickets": args.tickets, "seconds": seed_seconds, "tickets_per_second": args.tickets / seed_seconds},
+        "ingest": {
+            "tickets": stats["ingested"],
+            "tickets_per_second": stats["ingested"] / stats["ingest_seconds"] if stats["ingest_seconds"] else None,
+            "batch_ms": summary(stats["batch_ms"]),
+        },
+        "catch_up_tick": catch_up,
+        "ticks": {"duration_ms": summary(stats["tick_ms"]), "tickets": summary(stats["tick_tickets"])},
+        "alerts": dict(alerts),
+        "alert_latency_seconds": summary(latency),
+        "policy_lookups_per_second": policy_lookups_per_second(),
+        "timer_queue_size": timer_size,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--tickets", type=int, default=50_000, help="seeded population")
+    p.add_argument("--rate", type=float, default=1000, help="tickets/s ingested during the run")
+    p.add_argument("--batch", type=int, default=100, help="tickets per ingest call")
+    p.add_argument("--churn", type=float, default=0.2, help="share of each batch that flips an existing ticket's status")
+    p.add_argument("--duration", type=float, default=60, help="seconds of simulated load")
+    p.add_argument("--engine", choices=("poll", "timer"), default="poll")
+    p.add_argument("--time-scale", type=float, default=120, help="divide SLA durations and the poll interval by this")
+    p.add_argument("--max-age", type=float, default=86400, help="seeded tickets are up to this old (unscaled seconds)")
+    p.add_argument("--priority-mix", default="low=1,high=1")
+    p.add_argument("--tier-mix", default="silver=1,gold=1")
+    p.add_argument("--out", help="write the JSON here instead of stdout")
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    # the engine prints every alert; keep stdout for the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+        sys.stdout if os.getenv("BENCH_VERBOSE") else devnull
+    ):
+        report = asyncio.run(main(args))
+    out = json.dumps(report, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
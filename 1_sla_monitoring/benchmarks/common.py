@@ -0,0 +1,41 @@
+import random
+from datetime import datetime, timedelta
+
+PRIORITIES = ("low", "high")
+TIERS = ("silver", "gold")
+
+def synthetic_tickets(n, prefix="bench", status="open", max_age_seconds=3600, seed=0):
+    """
+    `n` ticket dicts shaped like TicketIn, spread uniformly over priorities/tiers and
+    created up to `max_age_seconds` ago.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    rows = []
+    for i in range(n):
+        created = now - timedelta(seconds=rng.uniform(0, max_age_seconds))
+        rows.append({
+            "id": f"{prefix}-{i}",
+            "priority": rng.choice(PRIORITIES),
+            "customer_tier": rng.choice(TIERS),
+            "created_at": created,
+            "updated_at": created,
+            "status": status,
+        })
+    return rows
+
+def reset_tables(engine):
+    from app.db import Base
+    import app.models  # noqa: F401  registers the tables on Base.metadata
+    from app.partitions import ensure_partitions
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        ensure_partitions(conn)
+
+async def claim_all_partitions():
+    """Act as the only SLA worker, so ticks and timers cover every ticket."""
+    from app.db import AsyncSessionLocal
+    from app.leases import leases
+    async with AsyncSessionLocal() as db:
+        await leases.rebalance(db)
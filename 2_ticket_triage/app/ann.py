@@ -0,0 +1,114 @@
+# app/ann.py
+import math
+
+import faiss
+import numpy as np
+
+from app.config import (
+    INDEX_TYPE, INDEX_NLIST, INDEX_PQ_M, INDEX_PQ_BITS, INDEX_HNSW_M, INDEX_EF_CONSTRUCTION,
+    INDEX_TRAIN_SAMPLE, INDEX_NPROBE, INDEX_EF_SEARCH,
+)
+
+KINDS = ("flat", "ivf", "ivfpq", "hnsw")
+
+def pq_m(dim: int) -> int:
+    """Sub-quantizer count: INDEX_PQ_M, or the largest divisor of `dim` up to dim/8."""
+    if INDEX_PQ_M:
+        return INDEX_PQ_M
+    return next(m for m in range(max(1, dim // 8), 0, -1) if dim % m == 0)
+
+def auto_nlist(n: int) -> int:
+    # ~4*sqrt(n) lists, but no fewer than 39 training points per centroid
+    return INDEX_NLIST or max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+def factory_string(kind: str, dim: int, n: int) -> str:
+    if kind == "flat":
+        return "Flat"
+    if kind == "ivf":
+        return f"IVF{auto_nlist(n)},Flat"
+    if kind == "ivfpq":
+        return f"IVF{auto_nlist(n)},PQ{pq_m(dim)}x{INDEX_PQ_BITS}"
+    if kind == "hnsw":
+        return f"HNSW{INDEX_HNSW_M}"
+    raise ValueError(f"unknown INDEX_TYPE {kind!r}, expected one of {', '.join(KINDS)}")
+
+def describe(kind: str = INDEX_TYPE, dim: int = 0) -> str:
+    """Short tag naming the index settings, part of the saved index's key."""
+    if kind == "ivfpq":
+        return f"ivfpq{pq_m(dim)}x{INDEX_PQ_BITS}"
+    if kind == "hnsw":
+        return f"hnsw{INDEX_HNSW_M}"
+    factory_string(kind, dim, 0)  # validates kind
+    return kind
+
+def new_index(kind: str, dim: int, n: int):
+    """
+    An empty inner-product index of `kind`, sized for about `n` vectors, that takes
+    add_with_ids. IVF indexes keep ids in their inverted lists and support
+    remove_ids themselves; flat and HNSW are wrapped in an IndexIDMap2.
+    """
+    index = faiss.index_factory(dim, factory_string(kind, dim, n), faiss.METRIC_INNER_PRODUCT)
+    if kind == "hnsw":
+        index.hnsw.efConstruction = INDEX_EF_CONSTRUCTION
+    if kind in ("flat", "hnsw"):
+        index = faiss.IndexIDMap2(index)
+    return index
+
+def train(index, vectors, seed: int = 0):
+    """Train IVF centroids / PQ codebooks on a random sample of `vectors`."""
+    if index.is_trained:
+        return
+    if len(vectors) > INDEX_TRAIN_SAMPLE:
+        rng = np.random.default_rng(seed)
+        vectors = vectors[np.sort(rng.choice(len(vectors), INDEX_TRAIN_SAMPLE, replace=False))]
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+
+def remove_ids(index, kind: str, labels):
+    """
+    `index` without the vectors labelled `labels`. HNSW graphs can't delete, so a
+    new one is built from the kept vectors as stored in the old one; nothing is
+    re-embedded.
+    """
+    labels = np.ascontiguousarray(labels, dtype=np.int64)
+    if kind != "hnsw":
+        index.remove_ids(faiss.IDSelectorBatch(labels))
+        return index
+    ids = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(ids, labels)
+    vectors = index.index.reconstruct_n(0, index.ntotal)[keep]
+    rebuilt = new_index(kind, index.d, int(keep.sum()))
+    if len(vectors):
+        rebuilt.add_with_ids(vectors, ids[keep])
+    return rebuilt
+
+def kind_of(index) -> str:
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+def mmap_flags(kind: str) -> int:
+    """
+    read_index flags that leave the vectors in the page cache, shared by every
+    worker mapping the same file: flat codes and HNSW storage need IO_FLAG_MMAP_IFC,
+    IVF inverted lists IO_FLAG_MMAP (faiss rejects the two combined for IVF).
+    """
+    if kind in ("ivf", "ivfpq"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+
+def search_params(index, nprobe=None, ef_search=None):
+    """Per-query SearchParameters for `index`, or None for exact search."""
+    kind = kind_of(index)
+    if kind in ("ivf", "ivfpq"):
+        return faiss.SearchParametersIVF(nprobe=nprobe or INDEX_NPROBE)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search or INDEX_EF_SEARCH)
+    return None
+
+def search(index, queries, k: int, nprobe=None, ef_search=None):
+    return index.search(queries, k, params=search_params(index, nprobe, ef_search))
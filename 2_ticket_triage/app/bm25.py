@@ -0,0 +1,124 @@
+# app/bm25.py
+import os
+import re
+import time
+
+import numpy as np
+
+from app.config import BM25_K1, BM25_B, RRF_K
+
+# words, plus dotted/dashed runs kept whole ("117.0.0", "x-forwarded-for") so
+# version numbers and product codes match exactly; their parts are indexed too
+TOKEN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+PART = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str):
+    tokens = []
+    for m in TOKEN.finditer(text.lower()):
+        token = m.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens += PART.findall(token)
+    return tokens
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed list of texts (the index's chunks, in chunk label
+    order). Postings are CSR arrays: the entries of term t are
+    postings[offsets[t]:offsets[t + 1]], each a text position and a term count.
+    They are saved as .npy files and memory-mapped on load like the rest of the
+    index, so only the vocabulary lives on the heap.
+    """
+    def __init__(self, vocab, offsets, postings, tfs, lengths):
+        self.vocab = vocab  # term -> term id
+        self.offsets = offsets
+        self.postings = postings
+        self.tfs = tfs
+        self.lengths = lengths
+        n = len(lengths)
+        df = np.diff(offsets)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self.avg_length = float(lengths.mean()) if n else 0.0
+
+    @classmethod
+    def build(cls, texts):
+        counts = {}  # term -> {position: count}
+        lengths = np.zeros(len(texts), dtype=np.uint32)
+        for pos, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[pos] = len(tokens)
+            for token in tokens:
+                row = counts.setdefault(token, {})
+                row[pos] = row.get(pos, 0) + 1
+        terms = sorted(counts)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(counts[t]) for t in terms], out=offsets[1:])
+        postings = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        for i, t in enumerate(terms):
+            row = counts[t]
+            postings[offsets[i]:offsets[i + 1]] = list(row)
+            tfs[offsets[i]:offsets[i + 1]] = np.minimum(list(row.values()), 65535)
+        return cls({t: i for i, t in enumerate(terms)}, offsets, postings, tfs, lengths)
+
+    def save(self, directory):
+        with open(os.path.join(directory, "bm25.vocab"), "w", encoding="utf-8") as f:
+            f.write("\n".join(sorted(self.vocab, key=self.vocab.get)))
+        for name in ("offsets", "postings", "tfs", "lengths"):
+            np.save(os.path.join(directory, f"bm25.{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        with open(os.path.join(directory, "bm25.vocab"), encoding="utf-8") as f:
+            terms = f.read().split("\n")
+        mode = "r" if mmap else None
+        offsets, postings, tfs, lengths = (
+            np.load(os.path.join(directory, f"bm25.{name}.npy"), mmap_mode=mode)
+            for name in ("offsets", "postings", "tfs", "lengths")
+        )
+        return cls({t: i for i, t in enumerate(terms) if t}, offsets, postings, tfs, lengths)
+
+    def search(self, query: str, n: int, budget_ms: float | None = None):
+        """
+        Top `n` (scores, positions), best first. Query terms are scored rarest
+        first; once `budget_ms` is spent the remaining, most common terms are
+        skipped.
+        """
+        start = time.perf_counter()
+        terms = sorted({self.vocab[t] for t in tokenize(query) if t in self.vocab}, key=lambda t: -self.idf[t])
+        positions, contributions = [], []
+        for t in terms:
+            if budget_ms is not None and positions and (time.perf_counter() - start) * 1000 > budget_ms:
+                break
+            lo, hi = self.offsets[t], self.offsets[t + 1]
+            docs = np.asarray(self.postings[lo:hi])
+            tf = self.tfs[lo:hi].astype(np.float32)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[docs] / self.avg_length)
+            positions.append(docs)
+            contributions.append(self.idf[t] * tf * (BM25_K1 + 1) / (tf + norm))
+        if not positions:
+            return np.zeros(0, np.float32), np.zeros(0, np.int64)
+        matched, inverse = np.unique(np.concatenate(positions), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions)).astype(np.float32)
+        top = np.argsort(-scores, kind="stable")[:n]
+        return scores[top], matched[top]
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K):
+    """
+    Fuse ranked label lists (best first, -1 padding ignored) into one: each
+    label scores sum(1 / (k + rank)) over the lists it appears in. Returns
+    (scores, labels) best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        rank = 0
+        for label in ranking:
+            if label < 0:
+                continue
+            rank += 1
+            fused[int(label)] = fused.get(int(label), 0.0) + 1 / (k + rank)
+    order = sorted(fused.items(), key=lambda item: -item[1])
+    return (
+        np.array([s for _, s in order], dtype=np.float32),
+        np.array([label for label, _ in order], dtype=np.int64),
+    )
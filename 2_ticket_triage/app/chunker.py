@@ -0,0 +1,96 @@
+# app/chunker.py
+import bisect
+import re
+from typing import NamedTuple
+
+from app.config import CHUNK_MODE, CHUNK_TOKENS, CHUNK_OVERLAP
+
+# sentence ends, line breaks and markdown-style headings start a new unit
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\s*\n+\s*(?=\S)")
+
+class Chunk(NamedTuple):
+    url: str
+    index: int
+    start: int  # character offsets into the document content
+    end: int
+
+def token_offsets(text: str, tokenizer):
+    """Character (start, end) of each model token in `text`, special tokens excluded."""
+    encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    return encoded["offset_mapping"]
+
+def token_windows(offsets, size: int, overlap: int):
+    """(start, end) character spans of windows of `size` tokens sharing `overlap` tokens."""
+    if not offsets:
+        return []
+    step = max(1, size - overlap)
+    spans = []
+    for first in range(0, len(offsets), step):
+        last = min(first + size, len(offsets)) - 1
+        spans.append((offsets[first][0], offsets[last][1]))
+        if last == len(offsets) - 1:
+            break
+    return spans
+
+def sentence_windows(text: str, offsets, size: int, overlap: int):
+    """
+    Whole sentences/lines packed up to `size` tokens per chunk, repeating trailing
+    sentences worth up to `overlap` tokens at the start of the next one. A single
+    sentence longer than `size` is cut into token windows.
+    """
+    if not offsets:
+        return []
+    starts = [s for s, _ in offsets]
+    units, pos = [], 0
+    for m in SENTENCE_BREAK.finditer(text):
+        if m.start() > pos:
+            units.append((pos, m.start()))
+        pos = m.end()
+    if pos < len(text):
+        units.append((pos, len(text)))
+    # token count of each unit, from the one tokenization of the whole text
+    counted = []
+    for s, e in units:
+        lo, hi = bisect.bisect_left(starts, s), bisect.bisect_left(starts, e)
+        if hi > lo:
+            counted.append((s, e, lo, hi))
+
+    spans, current = [], []
+    for s, e, lo, hi in counted:
+        if hi - lo > size:
+            if current:
+                spans.append((current[0][0], current[-1][1]))
+                current = []
+            spans += token_windows(offsets[lo:hi], size, overlap)
+            continue
+        if current and hi - current[0][2] > size:
+            spans.append((current[0][0], current[-1][1]))
+            # carry whole trailing sentences into the next chunk as overlap
+            kept = []
+            for unit in reversed(current):
+                if hi - unit[2] > size or current[-1][3] - unit[2] > overlap:
+                    break
+                kept.insert(0, unit)
+            current = kept
+        current.append((s, e, lo, hi))
+    if current:
+        spans.append((current[0][0], current[-1][1]))
+    return spans
+
+def chunk_spans(text: str, tokenizer, mode: str = CHUNK_MODE, size: int = CHUNK_TOKENS,
+                overlap: int = CHUNK_OVERLAP):
+    """Character spans covering `text` for the chunking `mode`: tokens, sentences or none."""
+    if mode == "none":
+        return [(0, len(text))]
+    offsets = token_offsets(text, tokenizer)
+    if mode == "sentences":
+        return sentence_windows(text, offsets, size, overlap)
+    return token_windows(offsets, size, overlap)
+
+def chunk_document(url: str, text: str, tokenizer, mode: str = CHUNK_MODE,
+                   size: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP):
+    return [Chunk(url, i, s, e) for i, (s, e) in enumerate(chunk_spans(text, tokenizer, mode, size, overlap))]
+
+def describe(mode: str = CHUNK_MODE, size: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP):
+    """Short tag naming the chunking settings, part of the saved index's key."""
+    return "none" if mode == "none" else f"{mode}{size}o{overlap}"
@@ -10,4 +10,77 @@ DATABASE_URL = os.getenv(
 # Directory where your JSON docs live
 DATA_DIR = os.getenv("DATA_DIR", "data")
 
+# SentenceTransformer used for documents and queries
+EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+
+# Concurrent /respond queries are embedded together: a batch runs once
+# EMBED_BATCH_SIZE queries are waiting or EMBED_MAX_WAIT_MS after the first one
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "2"))
+# threads running batches, and torch intra-op threads (0: torch's default, all cores);
+# keep EMBED_WORKERS * EMBED_TORCH_THREADS at or below the core count
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+EMBED_TORCH_THREADS = int(os.getenv("EMBED_TORCH_THREADS", "0"))
+
+# /respond results of recent queries, reused for the same normalized text or for a
+# query embedding at least QUERY_CACHE_SIMILARITY cosine-similar (0 turns that off);
+# QUERY_CACHE_SIZE=0 disables the cache. Cleared whenever the index changes.
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "600"))
+QUERY_CACHE_SIMILARITY = float(os.getenv("QUERY_CACHE_SIMILARITY", "0.95"))
+
+# Long docs are split before embedding: "tokens" (sliding window), "sentences"
+# (whole sentences/lines packed into the window) or "none" (one vector per doc,
+# truncated by the model). Windows stay under the model's 256-token limit.
+CHUNK_MODE = os.getenv("CHUNK_MODE", "tokens")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "40"))
+
+# FAISS index type: "flat" (exact), "ivf" (IVF-Flat), "ivfpq" (IVF-PQ) or "hnsw"
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+# IVF lists; 0 picks ~4*sqrt(vectors) at the first build
+INDEX_NLIST = int(os.getenv("INDEX_NLIST", "0"))
+# PQ sub-quantizers (0: dim/8) and bits per code
+INDEX_PQ_M = int(os.getenv("INDEX_PQ_M", "0"))
+INDEX_PQ_BITS = int(os.getenv("INDEX_PQ_BITS", "8"))
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", "32"))
+INDEX_EF_CONSTRUCTION = int(os.getenv("INDEX_EF_CONSTRUCTION", "80"))
+# vectors sampled to train IVF centroids / PQ codebooks
+INDEX_TRAIN_SAMPLE = int(os.getenv("INDEX_TRAIN_SAMPLE", "100000"))
+# default search breadth; /respond can override both per request
+INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", "16"))
+INDEX_EF_SEARCH = int(os.getenv("INDEX_EF_SEARCH", "64"))
+
+# Hybrid retrieval: BM25 over the same chunks, fused with the vector hits by
+# reciprocal rank fusion. BM25 runs while the query is embedded; terms still
+# unscored after BM25_BUDGET_MS (the most common ones) are skipped.
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1").lower() in ("1", "true", "yes")
+BM25_BUDGET_MS = float(os.getenv("BM25_BUDGET_MS", "20"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Optional cross-encoder rerank: /respond fetches the top RERANK_CANDIDATES
+# documents and rescores their best chunks in batches of RERANK_BATCH_SIZE, for
+# at most RERANK_BUDGET_MS; candidates left unscored keep the retrieval order.
+RERANK = os.getenv("RERANK", "0").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+
+# Built indexes are saved here, one subdirectory per model and corpus version
+INDEX_DIR = os.getenv("INDEX_DIR", "index")
+# how often (seconds) a worker looks there for an index saved by another process,
+# e.g. /admin/reindex in a sibling worker; 0 disables
+INDEX_POLL_SECONDS = float(os.getenv("INDEX_POLL_SECONDS", "5"))
+
+# Embedding runtime: "torch" (fp32), "torch-int8" (dynamic int8 quantization),
+# "onnx" or "onnx-int8" (ONNX Runtime; needs sentence-transformers[onnx])
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+# ONNX exports are cached here; on the index volume by default
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join(INDEX_DIR, "models"))
+# onnx-int8 AutoQuantizationConfig (avx2, avx512, avx512_vnni, arm64); empty picks from the CPU
+EMBED_ONNX_QUANTIZATION = os.getenv("EMBED_ONNX_QUANTIZATION", "")
+
 # (Optional) add more settings here, e.g. SLACK_WEBHOOK_URL, METRICS_NAMESPACE, etc.
@@ -0,0 +1,95 @@
+# app/embedder.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from app.config import EMBED_BATCH_SIZE, EMBED_MAX_WAIT_MS, EMBED_WORKERS, EMBED_TORCH_THREADS
+from app.metrics import EMBED_BATCH_QUERIES, EMBED_QUEUE_SECONDS
+
+class MicroBatcher:
+    """
+    Embeds concurrent single queries together. Callers block on a Future while a
+    worker thread takes the first waiting query, collects more for up to
+    `max_wait_ms` (at most `batch_size`), and runs one `encode(texts)` for the
+    whole batch, which costs little more than a batch of one. Threads start on
+    first use in each process, so a forked worker starts its own.
+    """
+    def __init__(self, encode, batch_size: int = EMBED_BATCH_SIZE, max_wait_ms: float = EMBED_MAX_WAIT_MS,
+                 workers: int = EMBED_WORKERS, torch_threads: int = EMBED_TORCH_THREADS):
+        self.encode = encode
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.workers = max(1, workers)
+        self.torch_threads = torch_threads
+        self.lock = threading.Lock()
+        self.pid = None
+        self.queue = None
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            if self.torch_threads:
+                # imported here: torch takes seconds to import and isn't needed before the model
+                try:
+                    import torch
+                    torch.set_num_threads(self.torch_threads)
+                except ImportError:
+                    pass
+            # a fresh queue: a forked child must not wait on its parent's threads
+            self.queue = queue.Queue()
+            for i in range(self.workers):
+                threading.Thread(target=self.run, args=(self.queue,), name=f"embedder-{i}", daemon=True).start()
+            self.pid = os.getpid()
+
+    def submit(self, text: str) -> Future:
+        if self.pid != os.getpid():
+            self.start()
+        future = Future()
+        self.queue.put((text, future, time.perf_counter()))
+        return future
+
+    def embed(self, text: str, timeout: float | None = None):
+        """The embedding of `text`, from whichever batch it lands in."""
+        future = self.submit(text)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise
+
+    def collect(self, q):
+        batch = [q.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self, q):
+        while True:
+            batch = self.collect(q)
+            now = time.perf_counter()
+            texts, futures = [], []
+            for text, f, queued in batch:
+                # callers that gave up and cancelled don't need a vector
+                if f.set_running_or_notify_cancel():
+                    EMBED_QUEUE_SECONDS.observe(now - queued)
+                    texts.append(text)
+                    futures.append(f)
+            if not texts:
+                continue
+            EMBED_BATCH_QUERIES.observe(len(texts))
+            try:
+                vectors = self.encode(texts)
+            except BaseException as e:
+                for f in futures:
+                    f.set_exception(e)
+                continue
+            for f, vector in zip(futures, vectors):
+                f.set_result(vector)
@@ -0,0 +1,95 @@
+# app/embedding.py
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+from app.config import EMBED_MODEL, EMBED_BACKEND, EMBED_CACHE_DIR, EMBED_ONNX_QUANTIZATION
+from app.index_store import build_lock, model_slug
+
+# torch: fp32 PyTorch, as before. torch-int8: Linear layers dynamically quantized
+# to int8 at load. onnx / onnx-int8: ONNX Runtime, exported (and quantized) once
+# into EMBED_CACHE_DIR.
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+def describe(name: str = EMBED_MODEL, backend: str = EMBED_BACKEND) -> str:
+    """
+    The model's part of the saved index's key. fp32 runtimes produce the same
+    vectors up to float error and share an index; int8 vectors drift, so they get
+    their own.
+    """
+    return f"{name}-int8" if backend.endswith("-int8") else name
+
+def cpu_quantization():
+    """AutoQuantizationConfig for this CPU: the widest integer instructions it has."""
+    if EMBED_ONNX_QUANTIZATION:
+        return EMBED_ONNX_QUANTIZATION
+    if os.uname().machine in ("aarch64", "arm64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        flags = ""
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    return "avx512" if "avx512f" in flags else "avx2"
+
+def export_onnx(name: str, backend: str, path: str):
+    """Export `name` to ONNX (quantized for onnx-int8) under `path`, via a temp dir."""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    root = os.path.dirname(path)
+    tmp = tempfile.mkdtemp(dir=root, prefix=".tmp-")
+    try:
+        model = SentenceTransformer(name, device="cpu", backend="onnx")
+        model.save_pretrained(tmp)
+        if backend == "onnx-int8":
+            export_dynamic_quantized_onnx_model(model, cpu_quantization(), tmp, push_to_hub=False)
+        os.rename(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+def onnx_file(path: str, backend: str) -> str:
+    """The exported model file, relative to `path`."""
+    files = sorted(os.path.relpath(p, path) for p in glob.glob(os.path.join(path, "**", "*.onnx"), recursive=True))
+    quantized = [f for f in files if "qint8" in os.path.basename(f)]
+    plain = [f for f in files if f not in quantized]
+    candidates = quantized if backend == "onnx-int8" else plain
+    if not candidates:
+        raise FileNotFoundError(f"no {backend} model under {path}; remove it to export again")
+    return candidates[0]
+
+def load_model(name: str = EMBED_MODEL, backend: str = EMBED_BACKEND):
+    """
+    A SentenceTransformer for `name` on the `backend` runtime. ONNX exports are
+    cached in EMBED_CACHE_DIR and reused across restarts and workers; the first
+    worker to need one exports it while the others wait for it. sentence_transformers
+    (and with it torch) is imported here rather than at module import.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    t0 = time.time()
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown EMBED_BACKEND {backend!r}, expected one of {', '.join(BACKENDS)}")
+    if backend == "torch":
+        model = SentenceTransformer(name, device="cpu")
+    elif backend == "torch-int8":
+        import torch
+
+        model = SentenceTransformer(name, device="cpu")
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    else:
+        path = os.path.join(EMBED_CACHE_DIR, f"{model_slug(name)}-{backend}")
+        if not os.path.isdir(path):
+            with build_lock(EMBED_CACHE_DIR):
+                if not os.path.isdir(path):
+                    print(f"Exporting {name} for {backend} to {path}", flush=True)
+                    export_onnx(name, backend, path)
+        model = SentenceTransformer(
+            path, device="cpu", backend="onnx", model_kwargs={"file_name": onnx_file(path, backend)},
+        )
+    print(f"Loaded {name} ({backend}) in {time.time() - t0:.1f}s", flush=True)
+    return model
@@ -0,0 +1,181 @@
+# app/index_store.py
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections.abc import Sequence
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+
+from app.ann import mmap_flags
+from app.bm25 import BM25Index
+from app.config import INDEX_DIR
+
+class TextStore(Sequence):
+    """
+    Strings packed into one UTF-8 blob plus an offsets array. Saved as two files and
+    memory-mapped on load, so the corpus text is paged in on demand and shared
+    between processes instead of living on each worker's heap.
+    """
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, texts):
+        encoded = [t.encode("utf-8") for t in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def save(self, directory, name):
+        self.blob.tofile(os.path.join(directory, f"{name}.bin"))
+        np.save(os.path.join(directory, f"{name}.offsets.npy"), self.offsets)
+
+    @classmethod
+    def load(cls, directory, name):
+        offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode="r")
+        path = os.path.join(directory, f"{name}.bin")
+        # np.memmap refuses empty files
+        blob = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, np.uint8)
+        return cls(blob, offsets)
+
+def corpus_fingerprint(data_dir):
+    """Hash of every *.json file's name and bytes; cheap enough to run on each start."""
+    h = hashlib.sha1()
+    for fname in sorted(os.listdir(data_dir)):
+        if not fname.endswith(".json"):
+            continue
+        with open(os.path.join(data_dir, fname), "rb") as f:
+            h.update(fname.encode("utf-8") + b"\0" + hashlib.sha1(f.read()).digest())
+    return h.hexdigest()
+
+def model_slug(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+def index_path(name, fingerprint, root=INDEX_DIR):
+    return os.path.join(root, f"{model_slug(name)}-{fingerprint[:16]}")
+
+@contextmanager
+def build_lock(root=INDEX_DIR):
+    """Serializes builds across workers: the first one builds, the rest load its files."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class SavedIndex:
+    """
+    A loaded index and its docs. Docs are stored sorted by their FAISS label, so the
+    label of a search hit maps back to a position with a binary search. Instances
+    are never mutated; a rebuild produces a new one that callers swap in.
+    """
+    def __init__(self, path, index, ids, texts, labels, hashes, chunk_labels, spans, meta, lexical=None):
+        self.path = path
+        self.index = index
+        self.ids = ids
+        self.texts = texts
+        self.labels = labels
+        self.hashes = hashes
+        # one entry per vector: its label (sorted) and character span in the doc
+        self.chunk_labels = chunk_labels
+        self.spans = spans
+        self.meta = meta
+        # BM25 over the same chunks, by position in chunk_labels
+        self.lexical = lexical
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions(self, labels):
+        """Positions in ids/texts of documents, by document label."""
+        return np.searchsorted(self.labels, labels)
+
+    def chunk_spans(self, chunk_labels):
+        """(start, end) in the parent doc's text of each chunk, by chunk label."""
+        return self.spans[np.searchsorted(self.chunk_labels, chunk_labels)]
+
+def save_index(path, index, ids, texts, labels, hashes, chunk_labels, spans, meta, lexical=None):
+    """
+    Write the index, its docs, its chunks (each sorted by label) and their BM25
+    index to `path` via a temporary directory renamed into place, so a reader
+    never sees a partial index.
+    Older versions with the same name are removed; processes still mapping them
+    keep their pages until they reload.
+    """
+    root = os.path.dirname(path) or "."
+    os.makedirs(root, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=root, prefix=".tmp-")
+    try:
+        os.chmod(tmp, 0o755)
+        faiss.write_index(index, os.path.join(tmp, "index.faiss"))
+        TextStore.from_strings(texts).save(tmp, "texts")
+        np.save(os.path.join(tmp, "labels.npy"), np.asarray(labels, dtype=np.int64))
+        np.save(os.path.join(tmp, "chunk_labels.npy"), np.asarray(chunk_labels, dtype=np.int64))
+        np.save(os.path.join(tmp, "chunk_spans.npy"), np.asarray(spans, dtype=np.int64).reshape(-1, 2))
+        if lexical is not None:
+            lexical.save(tmp)
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(meta, ids=list(ids), hashes=list(hashes), count=len(ids), saved_at=time.time()), f)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    prefix = os.path.basename(path).rsplit("-", 1)[0] + "-"
+    for name in os.listdir(root):
+        if name.startswith(prefix) and name != os.path.basename(path):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+def load_index(path, mmap=True):
+    """
+    The SavedIndex at `path`, or None if there is none (or it predates chunking).
+    An index saved before BM25 loads with `lexical` None.
+    """
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_path) or not os.path.exists(os.path.join(path, "chunk_spans.npy")):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    flags = mmap_flags(meta.get("kind", "flat")) if mmap else 0
+    index = faiss.read_index(os.path.join(path, "index.faiss"), flags)
+    mode = "r" if mmap else None
+    labels, chunk_labels, spans = (
+        np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+        for name in ("labels", "chunk_labels", "chunk_spans")
+    )
+    return SavedIndex(
+        path, index, meta.pop("ids"), TextStore.load(path, "texts"), labels, meta.pop("hashes"),
+        chunk_labels, spans, meta,
+        BM25Index.load(path, mmap) if os.path.exists(os.path.join(path, "bm25.vocab")) else None,
+    )
+
+def latest_index(name, root=INDEX_DIR):
+    """Path of the most recently saved index named `name`, whatever its corpus."""
+    if not os.path.isdir(root):
+        return None
+    prefix = model_slug(name) + "-"
+    paths = [
+        os.path.join(root, name) for name in os.listdir(root)
+        if name.startswith(prefix) and os.path.exists(os.path.join(root, name, "meta.json"))
+    ]
+    return max(paths, key=lambda p: os.path.getmtime(os.path.join(p, "meta.json")), default=None)
@@ -0,0 +1,208 @@
+# app/indexer.py
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import NamedTuple
+
+import faiss
+import numpy as np
+
+from app import ann
+from app.bm25 import BM25Index
+from app.config import DATA_DIR, INDEX_TYPE
+from app.index_store import (
+    SavedIndex, corpus_fingerprint, index_path, latest_index, build_lock, save_index, load_index,
+)
+from app.metrics import INDEX_BUILD_SECONDS
+
+# a chunk's FAISS label is its document's label followed by CHUNK_BITS of chunk
+# number; 47 + 16 bits keep labels positive int64
+LABEL_BITS = 47
+CHUNK_BITS = 16
+MAX_CHUNKS = 1 << CHUNK_BITS
+
+def load_documents(data_dir: str = DATA_DIR):
+    """
+    Read JSON docs (each file may be a dict or a list of dicts) into parallel lists
+    of urls and contents, skipping records without either.
+    """
+    ids, texts = [], []
+    for fname in sorted(os.listdir(data_dir)):
+        if not fname.endswith(".json"):
+            continue
+        path = os.path.join(data_dir, fname)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        # normalize to a list of records
+        records = data if isinstance(data, list) else [data]
+        for rec in records:
+            url = rec.get("url")
+            content = rec.get("content", "").strip()
+            if url and content:
+                ids.append(url)
+                texts.append(content)
+    return ids, texts
+
+def doc_label(url: str) -> int:
+    """Stable FAISS id of a document, derived from its url."""
+    return int.from_bytes(hashlib.sha1(url.encode("utf-8")).digest()[:8], "big") >> (64 - LABEL_BITS)
+
+def chunk_labels(url: str, count: int):
+    return (doc_label(url) << CHUNK_BITS) + np.arange(count, dtype=np.int64)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class Delta(NamedTuple):
+    added: list
+    changed: list
+    removed: list
+    unchanged: int
+
+    def summary(self):
+        return {
+            "added": len(self.added), "changed": len(self.changed),
+            "removed": len(self.removed), "unchanged": self.unchanged,
+        }
+
+def diff(base, docs):
+    """What turns `base` (a SavedIndex or None) into `docs` ({url: content})."""
+    old = dict(zip(base.ids, base.hashes)) if base is not None else {}
+    added, changed, unchanged = [], [], 0
+    for url, text in docs.items():
+        h = old.get(url)
+        if h is None:
+            added.append(url)
+        elif h != content_hash(text):
+            changed.append(url)
+        else:
+            unchanged += 1
+    removed = [url for url in old if url not in docs]
+    return Delta(added, changed, removed, unchanged)
+
+def apply_delta(base, docs, delta, embed, chunk, dim, kind=INDEX_TYPE):
+    """
+    A new in-memory index holding `docs`, plus the sorted chunk labels and their
+    (start, end) spans. `base` is re-read from disk with removed and changed docs'
+    chunks dropped, and only added and changed docs are chunked and embedded.
+    Without a usable base a fresh index of `kind` is trained on the new vectors.
+    """
+    if base is not None and not len(base.chunk_labels):
+        # nothing to keep, and an empty IVF base was never trained
+        base = None
+    if base is None:
+        index = None
+        kept_labels, kept_spans = np.zeros(0, np.int64), np.zeros((0, 2), np.int64)
+    else:
+        # a private, writable copy; the mapped one keeps serving queries meanwhile
+        index = faiss.read_index(os.path.join(base.path, "index.faiss"))
+        stale = np.zeros(len(base.chunk_labels), dtype=bool)
+        for url in delta.changed + delta.removed:
+            lo = doc_label(url) << CHUNK_BITS
+            stale[np.searchsorted(base.chunk_labels, lo):np.searchsorted(base.chunk_labels, lo + MAX_CHUNKS)] = True
+        if stale.any():
+            index = ann.remove_ids(index, base.meta.get("kind", "flat"), base.chunk_labels[stale])
+        kept_labels, kept_spans = base.chunk_labels[~stale], base.spans[~stale]
+
+    labels, spans, texts = [], [], []
+    for url in delta.added + delta.changed:
+        chunks = chunk(url, docs[url])
+        if len(chunks) > MAX_CHUNKS:
+            print(f"{url}: {len(chunks)} chunks, indexing the first {MAX_CHUNKS}", flush=True)
+            chunks = chunks[:MAX_CHUNKS]
+        labels.append(chunk_labels(url, len(chunks)))
+        spans += [(c.start, c.end) for c in chunks]
+        texts += [docs[url][c.start:c.end] for c in chunks]
+    embeddings = np.zeros((0, dim), np.float32)
+    if texts:
+        t0 = time.perf_counter()
+        embeddings = embed(texts)
+        INDEX_BUILD_SECONDS.labels("embed").observe(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    if index is None:
+        index = ann.new_index(kind, dim, len(embeddings))
+        if len(embeddings):
+            ann.train(index, embeddings)
+    if texts:
+        labels = np.concatenate(labels)
+        index.add_with_ids(embeddings, labels)
+        all_labels = np.concatenate([kept_labels, labels])
+        all_spans = np.concatenate([kept_spans, np.asarray(spans, dtype=np.int64)])
+        order = np.argsort(all_labels)
+        kept_labels, kept_spans = all_labels[order], all_spans[order]
+    INDEX_BUILD_SECONDS.labels("index").observe(time.perf_counter() - t0)
+    return index, kept_labels, kept_spans
+
+def build_lexical(docs, order, doc_labels, labels, spans):
+    """
+    BM25 over every chunk's text, by position in `labels`. Rebuilt in full on each
+    update: tokenizing the corpus costs a fraction of embedding even its changes.
+    """
+    t0 = time.perf_counter()
+    parents = np.searchsorted(doc_labels, np.asarray(labels, dtype=np.int64) >> CHUNK_BITS)
+    lexical = BM25Index.build([docs[order[p]][s:e] for p, (s, e) in zip(parents, spans)])
+    INDEX_BUILD_SECONDS.labels("lexical").observe(time.perf_counter() - t0)
+    return lexical
+
+def build_unsaved(docs, embed, chunk, dim, kind=INDEX_TYPE):
+    """A SavedIndex over `docs` ({url: content}) built in memory only, for benchmarks."""
+    delta = Delta(list(docs), [], [], 0)
+    index, labels, spans = apply_delta(None, docs, delta, embed, chunk, dim, kind)
+    order = sorted(docs, key=doc_label)
+    doc_labels = np.array([doc_label(u) for u in order], dtype=np.int64)
+    return SavedIndex(
+        None, index, order, [docs[u] for u in order], doc_labels,
+        [content_hash(docs[u]) for u in order], labels, spans, {"kind": kind},
+        build_lexical(docs, order, doc_labels, labels, spans),
+    )
+
+def sync_index(name, embed, chunk, dim, data_dir: str = DATA_DIR, kind=INDEX_TYPE, build=True):
+    """
+    Bring the saved index `name` (model and chunking settings) in line with
+    `data_dir` and return it memory-mapped, with the Delta applied (empty if it
+    was already current). `chunk(url, text)` splits a doc into Chunks and `kind`
+    picks the FAISS index type (see app.ann); `name` must differ per kind. Only docs
+    whose content hash is new or changed since the last saved index are chunked
+    and embedded; one process at a time updates, the others load its result.
+    With `build` False, returns (None, None) instead of updating.
+    """
+    fingerprint = corpus_fingerprint(data_dir)
+    path = index_path(name, fingerprint)
+    saved = load_index(path)
+    if saved is not None and saved.lexical is not None:
+        return saved, Delta([], [], [], len(saved))
+    if not build:
+        return None, None
+    with build_lock():
+        saved = load_index(path)
+        if saved is not None and saved.lexical is not None:
+            return saved, Delta([], [], [], len(saved))
+        t0 = time.perf_counter()
+        ids, texts = load_documents(data_dir)
+        # last record wins if a url appears twice
+        docs = dict(zip(ids, texts))
+        base_path = latest_index(name)
+        base = load_index(base_path) if base_path else None
+        INDEX_BUILD_SECONDS.labels("load").observe(time.perf_counter() - t0)
+        delta = diff(base, docs)
+        index, labels, spans = apply_delta(base, docs, delta, embed, chunk, dim, kind)
+        order = sorted(docs, key=doc_label)
+        doc_labels = np.array([doc_label(u) for u in order], dtype=np.int64)
+        meta = {"name": name, "fingerprint": fingerprint, "dim": dim, "kind": kind}
+        save_index(
+            path, index, order, [docs[u] for u in order], doc_labels,
+            [content_hash(docs[u]) for u in order], labels, spans, meta,
+            build_lexical(docs, order, doc_labels, labels, spans),
+        )
+        return load_index(path), delta
+
+if __name__ == "__main__":
+    # python -m app.indexer [data_dir]: update the saved index ahead of a deploy or restart
+    from app.rag import index_name, embed_documents, chunk_document, embedding_dim
+    t0 = time.time()
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    saved, delta = sync_index(index_name(), embed_documents, chunk_document, embedding_dim(), data_dir)
+    print(json.dumps(dict(delta.summary(), path=saved.path, seconds=round(time.time() - t0, 3))))
@@ -1,9 +1,11 @@
 # app/main.py
+import asyncio
 import os
 import time
 from datetime import datetime
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response as HTTPResponse
 from sqlalchemy.exc import OperationalError, IntegrityError
 from sqlalchemy.orm import Session
 
@@ -11,9 +13,15 @@ from app.config import DATA_DIR
 from app.db import engine, Base, get_db
 from app.models import Ticket, Response
 from app.classifier import classify_ticket
-from app.rag import ingest_documents_from_data, generate_response
+from app import rag
+from app.rag import sync_documents, generate_response, reindex_lock
+from app.metrics import (
+    RequestTimer, time_queries, render, profiler, PROFILER_ENABLED, PROFILER_MAX_SECONDS,
+)
 
 app = FastAPI()
+app.add_middleware(RequestTimer)
+time_queries(engine, "sync")
 
 @app.on_event("startup")
 def startup():
@@ -28,8 +36,16 @@ def startup():
             time.sleep(2)
     # 2) create tables
     Base.metadata.create_all(bind=engine)
-    # 3) build FAISS index
-    ingest_documents_from_data(DATA_DIR)
+    # 3) load the model and FAISS index in the background; GET /ready reports when done
+    rag.start_loading(DATA_DIR)
+
+@app.get("/ready")
+def ready():
+    """200 once the model and index are loaded, 503 while loading (or if loading failed)."""
+    if not rag.ready.is_set():
+        detail = f"Loading failed: {rag.load_error}" if rag.load_error else "Loading model and index"
+        raise HTTPException(status_code=503, detail=detail)
+    return {"status": "ready", "documents": len(rag.current)}
 
 @app.post("/classify")
 def classify(ticket: dict, db: Session = Depends(get_db)):
@@ -61,8 +77,29 @@ def respond(req: dict, db: Session = Depends(get_db)):
     if not existing:
         raise HTTPException(status_code=404, detail=f"Ticket '{ticket_id}' not found")
 
-    # 2) Generate the answer
-    answer, citations, stats = generate_response(req["query"])
+    if not rag.ready.is_set():
+        raise HTTPException(status_code=503, detail="Index is loading", headers={"Retry-After": "5"})
+
+    # 2) Generate the answer; optional ANN search breadth overrides
+    try:
+        search = {key: int(req[key]) for key in ("nprobe", "ef_search") if req.get(key) is not None}
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="`nprobe` and `ef_search` must be integers")
+    if any(v < 1 for v in search.values()):
+        raise HTTPException(status_code=400, detail="`nprobe` and `ef_search` must be positive")
+    # optional rerank switch and time budget
+    if req.get("rerank") is not None:
+        if not isinstance(req["rerank"], bool):
+            raise HTTPException(status_code=400, detail="`rerank` must be a boolean")
+        search["rerank"] = req["rerank"]
+    if req.get("rerank_budget_ms") is not None:
+        try:
+            search["rerank_budget_ms"] = float(req["rerank_budget_ms"])
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="`rerank_budget_ms` must be a number")
+        if not 0 <= search["rerank_budget_ms"] <= 10000:
+            raise HTTPException(status_code=400, detail="`rerank_budget_ms` must be between 0 and 10000")
+    answer, citations, stats = generate_response(req["query"], **search)
     now = datetime.utcnow()
     resp = Response(
         ticket_id=ticket_id,
@@ -83,3 +120,45 @@ def respond(req: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Failed to save response: " + str(e))
 
     return {"answer": answer, "citations": citations}
+
+@app.post("/admin/reindex")
+def reindex():
+    """
+    Re-read DATA_DIR and embed only new or changed docs. Runs in the threadpool;
+    queries keep using the previous index until the new one is swapped in. Other
+    workers pick the saved index up within INDEX_POLL_SECONDS.
+    """
+    if not reindex_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="Reindex already running")
+    try:
+        t0 = time.time()
+        delta = sync_documents(DATA_DIR)
+    finally:
+        reindex_lock.release()
+    return dict(delta.summary(), seconds=round(time.time() - t0, 3))
+
+@app.get("/metrics")
+def metrics():
+    body, content_type = render()
+    return HTTPResponse(body, media_type=content_type)
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10, gt=0, le=PROFILER_MAX_SECONDS),
+    interval: float = Query(0.005, ge=0.001, le=1),
+):
+    """
+    Sample all threads for `seconds` and return collapsed stacks for a flame graph.
+    Only with PROFILER_ENABLED; one profile at a time.
+    """
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404)
+    try:
+        profiler.start(interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+    return profiler.collapsed()
@@ -0,0 +1,128 @@
+# app/query_cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+
+from app.config import QUERY_CACHE_SIZE, QUERY_CACHE_TTL, QUERY_CACHE_SIMILARITY
+from app.metrics import QUERY_CACHE_LOOKUPS
+
+def normalize(query: str) -> str:
+    """Cache key text: case and whitespace don't change what is retrieved."""
+    return " ".join(query.lower().split())
+
+class Entry(NamedTuple):
+    embedding: np.ndarray
+    hits: list
+    expires: float
+    slot: int | None  # row in QueryCache.vectors, None if exact-match only
+
+class QueryCache:
+    """
+    Retrieval results of recent queries against one index snapshot, found two ways:
+    by normalized query text and search parameters, which skips embedding and
+    search, or by an embedding whose cosine similarity to a cached one is at least
+    `similarity`, which skips the search. Entries expire after `ttl` seconds and
+    the least recently used is evicted when `size` are held. `size` 0 disables
+    the cache and `similarity` 0 the semantic lookup.
+    """
+    def __init__(self, size: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL,
+                 similarity: float = QUERY_CACHE_SIMILARITY):
+        self.size = size
+        self.ttl = ttl
+        self.similarity = similarity
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # (text, params) -> Entry, least recently used first
+        # embeddings of semantically searchable entries, sized for the owner's
+        # index on invalidate(); free rows are zero
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.slot_keys = []
+        self.free = []
+        self.owner = None
+
+    def invalidate(self, snapshot):
+        """Tie the cache to `snapshot`, dropping everything unless it is the same saved index."""
+        with self.lock:
+            same = (
+                self.owner is not None and snapshot is not None and snapshot.path is not None
+                and snapshot.path == self.owner.path
+            )
+            if not same:
+                size = max(self.size, 0)
+                dim = snapshot.index.d if snapshot is not None else 0
+                self.entries.clear()
+                self.vectors = np.zeros((size, dim), dtype=np.float32)
+                self.slot_keys = [None] * size
+                self.free = list(range(size))
+            self.owner = snapshot
+
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        if entry.slot is not None:
+            self.vectors[entry.slot] = 0
+            self.slot_keys[entry.slot] = None
+            self.free.append(entry.slot)
+
+    def get(self, snapshot, query: str, params: tuple):
+        """The Entry cached for this exact query, or None."""
+        if self.size <= 0 or snapshot is not self.owner:
+            return None
+        key = (normalize(query), params)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self.remove(key)
+                entry = None
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+        QUERY_CACHE_LOOKUPS.labels("exact").inc()
+        return entry
+
+    def get_similar(self, snapshot, query: str, params: tuple, embedding):
+        """
+        Hits of the most similar cached query with the same params, or None. A hit
+        is also cached under this query's text, expiring with the entry it reused.
+        """
+        if self.size <= 0 or snapshot is not self.owner:
+            return None
+        found = None
+        if self.similarity > 0:
+            with self.lock:
+                scores = self.vectors @ embedding
+                now = time.monotonic()
+                for slot in np.argsort(-scores):
+                    if scores[slot] < self.similarity:
+                        break
+                    key = self.slot_keys[slot]
+                    entry = self.entries[key]
+                    if key[1] == params and entry.expires > now:
+                        self.entries.move_to_end(key)
+                        found = entry
+                        break
+        if found is None:
+            QUERY_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+        QUERY_CACHE_LOOKUPS.labels("semantic").inc()
+        self.put(snapshot, query, params, embedding, found.hits, found.expires, searchable=False)
+        return found.hits
+
+    def put(self, snapshot, query: str, params: tuple, embedding, hits, expires=None, searchable=True):
+        if self.size <= 0 or snapshot is not self.owner:
+            # computed against an index that has since been replaced
+            return
+        key = (normalize(query), params)
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            while len(self.entries) >= self.size:
+                self.remove(next(iter(self.entries)))
+            slot = None
+            if searchable and self.similarity > 0:
+                slot = self.free.pop()
+                self.vectors[slot] = embedding
+                self.slot_keys[slot] = key
+            expires = expires if expires is not None else time.monotonic() + self.ttl
+            self.entries[key] = Entry(embedding, hits, expires, slot)
@@ -1,74 +1,260 @@
 # app/rag.py
 import os
-import json
+import threading
 import time
 import faiss
-from sentence_transformers import SentenceTransformer
-from app.config import DATA_DIR
+from app.config import (
+    DATA_DIR, CHUNK_MODE, INDEX_TYPE, INDEX_POLL_SECONDS, HYBRID_SEARCH, BM25_BUDGET_MS,
+    RERANK, RERANK_CANDIDATES, RERANK_BUDGET_MS,
+)
+from app import ann, chunker, embedding
+from app.bm25 import reciprocal_rank_fusion
+from app.embedder import MicroBatcher
+from app.query_cache import QueryCache
+from app.reranker import Reranker
+from app.index_store import SavedIndex, latest_index, load_index
+from app.indexer import sync_index, CHUNK_BITS
+from app.metrics import EMBED_SECONDS, LEXICAL_SECONDS, SEARCH_SECONDS, INDEX_BUILD_SECONDS
 
-# 1) Embed model
-embed_model = SentenceTransformer("all-MiniLM-L6-v2")
-embedding_dim = embed_model.get_sentence_embedding_dimension()
+# 1) Embed model, loaded on first use (or up front by preload) so importing this
+# module doesn't pay for torch and the model weights
+_model = None
+_model_lock = threading.Lock()
 
-# Globals for FAISS index and docs
-index: faiss.IndexFlatIP | None = None
-doc_ids: list[str] = []
-doc_texts: list[str] = []
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = embedding.load_model()
+    return _model
+
+def embedding_dim() -> int:
+    return get_model().get_sentence_embedding_dimension()
+
+def index_name() -> str:
+    """Saved indexes are only reused with the same model (and precision), chunking and index type."""
+    return f"{embedding.describe()}-{chunker.describe()}-{ann.describe(INDEX_TYPE, embedding_dim())}"
+
+# chunks fetched per requested document, before collapsing them to documents
+CHUNKS_PER_DOC = 1 if CHUNK_MODE == "none" else 8
+
+# The index and docs queries run against. Replaced as a whole on (re)index, so a
+# query holding a reference keeps a consistent view while an update runs.
+current: SavedIndex | None = None
+reindex_lock = threading.Lock()
+# set once the model is loaded and `current` matches the corpus; GET /ready
+ready = threading.Event()
+load_error: str | None = None
+
+def embed_documents(texts: list[str]):
+    """Unit-length float32 embeddings, so inner product is cosine similarity."""
+    embeddings = get_model().encode(texts, convert_to_numpy=True)
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+# concurrent /respond calls share forward passes instead of each running a batch of one
+query_embedder = MicroBatcher(embed_documents)
+# repeated and near-duplicate questions skip embedding and/or search
+query_cache = QueryCache()
+# optional second stage over a wider candidate set; loaded with the model when RERANK is on
+reranker = Reranker()
+
+def chunk_document(url: str, text: str):
+    return chunker.chunk_document(url, text, get_model().tokenizer)
+
+def swap_in(saved: SavedIndex):
+    global current
+    current = saved
+    query_cache.invalidate(saved)
+
+def sync_documents(data_dir: str = DATA_DIR):
+    """
+    Make the index match the JSON docs in `data_dir` and swap it in. A saved index
+    for this model, chunking, index type and corpus is loaded memory-mapped as is;
+    otherwise only new or changed docs are chunked and embedded on top of the last
+    saved one. Returns the delta. The caller holds reindex_lock.
+    """
+    t0 = time.perf_counter()
+    if RERANK:
+        reranker.get_model()
+    saved, delta = sync_index(index_name(), embed_documents, chunk_document, embedding_dim(), data_dir)
+    try:
+        # mark it the latest even if it was saved before, so refresh_index in other
+        # workers moves to it rather than to a newer index of another corpus
+        os.utime(os.path.join(saved.path, "meta.json"))
+    except OSError:
+        pass
+    swap_in(saved)
+    INDEX_BUILD_SECONDS.labels("total").observe(time.perf_counter() - t0)
+    ready.set()
+    return delta
 
 def ingest_documents_from_data(data_dir: str = DATA_DIR):
+    """sync_documents under reindex_lock, waiting for a running reindex."""
+    with reindex_lock:
+        return sync_documents(data_dir)
+
+_next_index_check = 0.0
+
+def refresh_index():
     """
-    Load JSON docs (each file may be a dict or a list of dicts) and build a FAISS index.
+    Swap in the latest saved index if another process saved one since ours, e.g.
+    /admin/reindex in a sibling worker or `python -m app.indexer`. Checks at most
+    every INDEX_POLL_SECONDS, and not while this process is (re)indexing.
     """
-    global index, doc_ids, doc_texts
-
-    doc_ids = []
-    doc_texts = []
-
-    for fname in os.listdir(data_dir):
-        if not fname.endswith(".json"):
-            continue
-        path = os.path.join(data_dir, fname)
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        # normalize to a list of records
-        records = data if isinstance(data, list) else [data]
-        for rec in records:
-            url = rec.get("url")
-            content = rec.get("content", "").strip()
-            if url and content:
-                doc_ids.append(url)
-                doc_texts.append(content)
-
-    if not doc_texts:
-        index = None
+    global _next_index_check
+    now = time.monotonic()
+    if not INDEX_POLL_SECONDS or now < _next_index_check or current is None:
         return
+    if not reindex_lock.acquire(blocking=False):
+        return
+    try:
+        _next_index_check = now + INDEX_POLL_SECONDS
+        path = latest_index(index_name())
+        if path is None or path == current.path:
+            return
+        saved = load_index(path)
+        if saved is not None and saved.lexical is not None:
+            swap_in(saved)
+            print(f"Loaded index {path}, saved by another process", flush=True)
+    finally:
+        reindex_lock.release()
 
-    # 2) Compute embeddings
-    embeddings = embed_model.encode(doc_texts, convert_to_numpy=True)
-    # 3) Normalize to unit length for cosine
-    faiss.normalize_L2(embeddings)
-    # 4) Build FAISS index (inner-product)
-    index = faiss.IndexFlatIP(embedding_dim)
-    index.add(embeddings)
-
-def generate_response(query: str, k: int = 5):
+def start_loading(data_dir: str = DATA_DIR):
     """
-    Embed the query, search FAISS, and return a simple snippet-based answer.
+    Load the model and index in a background thread so the server answers (and
+    GET /ready says 503) meanwhile. Does nothing if they were preloaded.
     """
-    if index is None or not doc_ids:
-        return "No documents indexed.", [], {"tokens_in": 0, "tokens_out": 0, "retrieval_ms": 0}
+    if ready.is_set():
+        return
+
+    def load():
+        global load_error
+        try:
+            ingest_documents_from_data(data_dir)
+        except Exception as e:
+            load_error = f"{type(e).__name__}: {e}"
+            print(f"Loading the index failed: {load_error}", flush=True)
+
+    threading.Thread(target=load, name="rag-load", daemon=True).start()
 
+def preload(data_dir: str = DATA_DIR):
+    """
+    Load the model, and the saved index if it is current, in a process that then
+    forks workers (gunicorn's master), so they share the weights copy-on-write and
+    start ready. Nothing is embedded here: torch's OpenMP pool isn't fork-safe once
+    used. If the index needs building, the first worker builds it.
+    """
     t0 = time.time()
-    q_emb = embed_model.encode([query], convert_to_numpy=True)
-    faiss.normalize_L2(q_emb)
+    get_model()
+    if RERANK:
+        reranker.get_model()
+    saved, _ = sync_index(index_name(), embed_documents, chunk_document, embedding_dim(), data_dir, build=False)
+    if saved is not None:
+        swap_in(saved)
+        ready.set()
+    print(f"Preloaded model{' and index' if saved is not None else ''} in {time.time() - t0:.1f}s", flush=True)
+
+def collapse(snapshot: SavedIndex, scores, labels, k: int):
+    """
+    Top `k` documents from chunk hits sorted by score, each with its best chunk:
+    [(doc position, score, chunk text)].
+    """
+    best = {}
+    for score, label in zip(scores, labels):
+        if label < 0:
+            break
+        doc = int(label) >> CHUNK_BITS
+        if doc not in best:
+            best[doc] = (float(score), label)
+            if len(best) == k:
+                break
+    if not best:
+        return []
+    positions = snapshot.positions(list(best))
+    spans = snapshot.chunk_spans([label for _, label in best.values()])
+    return [
+        (int(pos), score, snapshot.texts[pos][start:end])
+        for pos, (score, _), (start, end) in zip(positions, best.values(), spans)
+    ]
+
+def lexical_search(snapshot: SavedIndex, query: str, n: int):
+    """Chunk labels of the top `n` BM25 matches, or None if the index has no BM25."""
+    if snapshot.lexical is None:
+        return None
+    t0 = time.perf_counter()
+    _, positions = snapshot.lexical.search(query, n, BM25_BUDGET_MS)
+    LEXICAL_SECONDS.observe(time.perf_counter() - t0)
+    return snapshot.chunk_labels[positions]
+
+def search_documents(snapshot: SavedIndex, q_emb, lexical, n: int, nprobe: int | None = None,
+                     ef_search: int | None = None):
+    """Top `n` documents for a query embedding, with `lexical` chunk labels fused in if given."""
+    t0 = time.perf_counter()
+    D, I = ann.search(snapshot.index, q_emb.reshape(1, -1), n * CHUNKS_PER_DOC, nprobe, ef_search)
+    SEARCH_SECONDS.observe(time.perf_counter() - t0)
+    scores, labels = D[0], I[0]
+    if lexical is not None:
+        scores, labels = reciprocal_rank_fusion([labels, lexical])
+    return collapse(snapshot, scores, labels, n)
+
+def rerank_hits(query: str, hits, k: int, budget_ms: float = RERANK_BUDGET_MS):
+    """
+    (top `k` of `hits` reordered by the cross-encoder, whether every hit was
+    scored). Hits the budget didn't reach keep their retrieval order behind the
+    scored ones; scores stay the retriever's.
+    """
+    order, scored = reranker.rerank(query, [text for _, _, text in hits], budget_ms)
+    return [hits[i] for i in order[:k]], scored == len(hits)
+
+def generate_response(query: str, k: int = 5, nprobe: int | None = None, ef_search: int | None = None,
+                      rerank: bool | None = None, rerank_budget_ms: float | None = None):
+    """
+    Embed the query, search FAISS for chunks, collapse them to the top `k`
+    documents and return a simple snippet-based answer. `nprobe` (IVF) and
+    `ef_search` (HNSW) trade recall for latency; None uses the configured default.
+    With HYBRID_SEARCH, BM25 chunk matches are fused in by reciprocal rank, so
+    exact terms like error codes and versions count. With `rerank` (default
+    RERANK), the top RERANK_CANDIDATES documents are rescored by the cross-encoder
+    for up to `rerank_budget_ms` (default RERANK_BUDGET_MS). Hits come from
+    query_cache when the same or a near-identical query was answered recently
+    against the current index; a rerank cut short by its budget isn't cached.
+    """
+    refresh_index()
+    snapshot = current
+    if snapshot is None or not len(snapshot):
+        return "No documents indexed.", [], {"tokens_in": 0, "tokens_out": 0, "retrieval_ms": 0}
 
-    D, I = index.search(q_emb, k)
-    retrieval_ms = int((time.time() - t0) * 1000)
+    rerank = RERANK if rerank is None else rerank
+    n = max(k, RERANK_CANDIDATES) if rerank else k
+    params = (k, nprobe, ef_search, rerank)
+    t0 = time.perf_counter()
+    cached = query_cache.get(snapshot, query, params)
+    if cached is not None:
+        hits = cached.hits
+    else:
+        submitted = time.perf_counter()
+        pending = query_embedder.submit(query)
+        # timed to when the vector is ready, not to when we collect it after BM25
+        pending.add_done_callback(lambda _: EMBED_SECONDS.observe(time.perf_counter() - submitted))
+        # BM25 runs here while the embedder thread works on the query (LEXICAL_SECONDS)
+        lexical = lexical_search(snapshot, query, n * CHUNKS_PER_DOC) if HYBRID_SEARCH else None
+        q_emb = pending.result()
+        hits = query_cache.get_similar(snapshot, query, params, q_emb)
+        if hits is None:
+            hits = search_documents(snapshot, q_emb, lexical, n, nprobe, ef_search)
+            complete = True
+            if rerank:
+                budget = RERANK_BUDGET_MS if rerank_budget_ms is None else rerank_budget_ms
+                hits, complete = rerank_hits(query, hits, k, budget)
+            if complete:
+                query_cache.put(snapshot, query, params, q_emb, hits)
+    retrieval_ms = int((time.perf_counter() - t0) * 1000)
 
-    hits = I[0]
-    docs = [doc_texts[i] for i in hits]
-    sources = [doc_ids[i] for i in hits]
+    # the best matching chunk of each document, not its opening lines
+    docs = [text for _, _, text in hits]
+    sources = [snapshot.ids[pos] for pos, _, _ in hits]
 
     context = "\n\n".join(docs)
     answer = f"Based on these snippets:\n\n{context[:500]}..."
@@ -0,0 +1,88 @@
+# app/reranker.py
+import threading
+import time
+
+import numpy as np
+
+from app.config import RERANK_MODEL, RERANK_BATCH_SIZE
+from app.metrics import RERANK_SECONDS, RERANK_RESULTS
+
+class Reranker:
+    """
+    Rescores (query, passage) pairs with a cross-encoder, which reads the two
+    together and ranks better than comparing separately computed embeddings, at
+    the cost of a forward pass per pair. Passages are scored in the retriever's
+    order, a batch at a time, while the time budget allows: each batch is sized
+    to what a running per-pair cost estimate says still fits (the very first
+    batch, run without one, can overrun). The model is loaded by get_model(), at
+    startup when RERANK is on; a rerank asked for before then is skipped and
+    starts the load in the background, so no request waits on it.
+    """
+    def __init__(self, name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE):
+        self.name = name
+        self.batch_size = max(1, batch_size)
+        self.model = None
+        self.lock = threading.Lock()
+        # background load started by a rerank that arrived before the model
+        self.loader = None
+        self.loader_lock = threading.Lock()
+        # seconds per pair, a moving average over recent batches; None until the first
+        self.pair_seconds = None
+
+    def get_model(self):
+        if self.model is None:
+            with self.lock:
+                if self.model is None:
+                    # imported here, like the embedding model: it brings in torch
+                    from sentence_transformers import CrossEncoder
+
+                    t0 = time.time()
+                    self.model = CrossEncoder(self.name, device="cpu")
+                    print(f"Loaded reranker {self.name} in {time.time() - t0:.1f}s", flush=True)
+        return self.model
+
+    def load_in_background(self):
+        def load():
+            try:
+                self.get_model()
+            except Exception as e:
+                print(f"Loading reranker {self.name} failed: {e}", flush=True)
+
+        with self.loader_lock:
+            if self.model is None and (self.loader is None or not self.loader.is_alive()):
+                self.loader = threading.Thread(target=load, name="reranker-load", daemon=True)
+                self.loader.start()
+
+    def rerank(self, query: str, passages: list[str], budget_ms: float) -> tuple[list[int], int]:
+        """
+        (order, scored): positions of `passages` best first, and how many were
+        scored. The scored ones, a prefix of the retriever's ranking, are sorted by
+        cross-encoder score; the rest follow in their original order, so a budget
+        of 0, or a model not loaded yet, returns the retriever's ranking unchanged.
+        """
+        model = self.model
+        if model is None:
+            self.load_in_background()
+            RERANK_RESULTS.labels("skipped").inc()
+            return list(range(len(passages))), 0
+        t0 = time.perf_counter()
+        deadline = t0 + budget_ms / 1000
+        scores = []
+        while len(scores) < len(passages):
+            n = min(self.batch_size, len(passages) - len(scores))
+            remaining = deadline - time.perf_counter()
+            if self.pair_seconds is not None and n * self.pair_seconds > remaining:
+                n = int(remaining / self.pair_seconds)
+            if n < 1 or remaining <= 0:
+                break
+            t1 = time.perf_counter()
+            batch = passages[len(scores):len(scores) + n]
+            scores.extend(model.predict([(query, p) for p in batch], batch_size=n, show_progress_bar=False))
+            cost = (time.perf_counter() - t1) / n
+            self.pair_seconds = cost if self.pair_seconds is None else 0.8 * self.pair_seconds + 0.2 * cost
+        scored = len(scores)
+        order = [int(i) for i in np.argsort(-np.asarray(scores, dtype=np.float32), kind="stable")]
+        order += range(scored, len(passages))
+        RERANK_SECONDS.observe(time.perf_counter() - t0)
+        RERANK_RESULTS.labels("full" if scored == len(passages) else "partial" if scored else "skipped").inc()
+        return order, scored
@@ -0,0 +1,119 @@
+"""
+Recall, latency, build time and memory of the FAISS index types against exact
+(flat) search. Vectors are the bundled corpus' chunk embeddings, or with
+`--synthetic N` N clustered unit vectors, which shows the trade-offs at sizes the
+corpus doesn't reach. Queries are held-out vectors; recall@k is the share of each
+query's exact top k that the index returns. IVF is swept over `--nprobe` and
+HNSW over `--ef-search`. Prints JSON.
+
+    python -m benchmarks.bench_ann --kinds flat ivf ivfpq hnsw --nprobe 1 4 16 64 --ef-search 16 64 256
+    python -m benchmarks.bench_ann --synthetic 200000 --dim 384
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from app import ann
+from benchmarks.common import summary, rss_mb
+
+def corpus_vectors(data_dir):
+    from app import rag
+    from app.indexer import load_documents
+
+    ids, texts = load_documents(data_dir)
+    chunks = [
+        text[c.start:c.end] for url, text in zip(ids, texts) for c in rag.chunk_document(url, text)
+    ]
+    return rag.embed_documents(chunks)
+
+def synthetic_vectors(n, dim, seed, clusters=1000, spread=1.0):
+    """Unit vectors scattered around random centres, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    x = centres[rng.integers(0, clusters, n)] + spread * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(x)
+    return x
+
+def recall(found, truth, k):
+    return float(np.mean([len(set(f[:k]) & set(t[:k])) / k for f, t in zip(found, truth)]))
+
+def timed_search(index, queries, k, **params):
+    latencies, found = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        _, I = ann.search(index, q.reshape(1, -1), k, **params)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        found.append(I[0])
+    return found, latencies
+
+def run(kind, base, queries, truth, args):
+    rss0 = rss_mb()
+    t0 = time.perf_counter()
+    index = ann.new_index(kind, base.shape[1], len(base))
+    ann.train(index, base)
+    t1 = time.perf_counter()
+    index.add_with_ids(base, np.arange(len(base), dtype=np.int64))
+    t2 = time.perf_counter()
+    result = {
+        "kind": kind,
+        "factory": ann.factory_string(kind, base.shape[1], len(base)),
+        "train_seconds": t1 - t0,
+        "add_seconds": t2 - t1,
+        # what a saved index.faiss takes on disk / in the page cache
+        "index_mb": len(faiss.serialize_index(index)) / 2**20,
+        "rss_delta_mb": rss_mb() - rss0,
+        "runs": [],
+    }
+    sweep = {"ivf": ("nprobe", args.nprobe), "ivfpq": ("nprobe", args.nprobe), "hnsw": ("ef_search", args.ef_search)}
+    param, values = sweep.get(kind, (None, [None]))
+    for value in values:
+        found, latencies = timed_search(index, queries, args.k, **({param: value} if param else {}))
+        result["runs"].append({
+            **({param: value} if param else {}),
+            f"recall@{args.k}": recall(found, truth, args.k),
+            "recall@1": recall(found, truth, 1),
+            "search_ms": summary(latencies),
+        })
+    return result
+
+def main(args):
+    x = synthetic_vectors(args.synthetic, args.dim, args.seed) if args.synthetic else corpus_vectors(args.data)
+    rng = np.random.default_rng(args.seed)
+    order = rng.permutation(len(x))
+    queries, base = x[order[:args.queries]], np.ascontiguousarray(x[order[args.queries:]])
+
+    exact = faiss.IndexFlatIP(base.shape[1])
+    exact.add(base)
+    _, truth = exact.search(queries, args.k)
+    del exact
+    return {
+        "source": f"synthetic:{args.synthetic}" if args.synthetic else args.data,
+        "vectors": len(base), "dim": base.shape[1], "queries": len(queries), "k": args.k,
+        "results": [run(kind, base, queries, truth, args) for kind in args.kinds],
+    }
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--kinds", nargs="+", default=list(ann.KINDS), choices=ann.KINDS)
+    p.add_argument("--nprobe", nargs="+", type=int, default=[1, 4, 16, 64])
+    p.add_argument("--ef-search", nargs="+", type=int, default=[16, 64, 256])
+    p.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of the corpus")
+    p.add_argument("--dim", type=int, default=384, help="dimension of synthetic vectors")
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--data", default="data")
+    p.add_argument("--out", help="write the JSON here instead of stdout")
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    out = json.dumps(main(args), indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
@@ -0,0 +1,139 @@
+"""
+Embedding backends against the fp32 PyTorch baseline on the bundled corpus:
+load time (the first load of an ONNX backend includes its export), memory,
+throughput embedding every chunk, single-query latency, how far each chunk's
+vector drifts from the baseline's (cosine), and retrieval quality on sentences
+sampled from the docs, with the overlap of each backend's top k documents and
+the baseline's. Prints JSON.
+
+    python -m benchmarks.bench_backends --backends torch torch-int8 onnx onnx-int8
+"""
+import argparse
+import contextlib
+import gc
+import json
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from app import chunker, embedding
+from app.indexer import load_documents
+from benchmarks.common import sample_queries, rank_of, retrieval_scores, summary, rss_mb
+
+def encode(model, texts, batch_size):
+    vectors = model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def top_docs(vectors, chunk_urls, query_vectors, k, fetch):
+    """Top `k` distinct urls per query from exact search over chunk vectors."""
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    _, I = index.search(query_vectors, fetch)
+    results = []
+    for row in I:
+        urls = []
+        for pos in row:
+            if pos >= 0 and chunk_urls[pos] not in urls:
+                urls.append(chunk_urls[pos])
+                if len(urls) == k:
+                    break
+        results.append(urls)
+    return results
+
+def run(backend, chunks, queries, args):
+    rss0 = rss_mb()
+    t0 = time.perf_counter()
+    model = embedding.load_model(args.model, backend)
+    first_load = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    del model
+    gc.collect()
+    model = embedding.load_model(args.model, backend)
+    load = time.perf_counter() - t0
+    loaded_rss = rss_mb() - rss0
+
+    encode(model, chunks[:args.batch_size], args.batch_size)  # warm up
+    t0 = time.perf_counter()
+    vectors = encode(model, chunks, args.batch_size)
+    throughput = len(chunks) / (time.perf_counter() - t0)
+
+    latencies = []
+    for q, _ in queries[:args.latency_queries]:
+        t0 = time.perf_counter()
+        model.encode([q], convert_to_numpy=True)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    query_vectors = encode(model, [q for q, _ in queries], args.batch_size)
+    del model
+    gc.collect()
+    return {
+        "backend": backend,
+        "first_load_seconds": first_load,
+        "load_seconds": load,
+        "model_rss_mb": loaded_rss,
+        "chunks_per_second": throughput,
+        "query_ms": summary(latencies),
+    }, vectors, query_vectors
+
+def main(args):
+    ids, texts = load_documents(args.data)
+    ids, texts = ids[:args.docs or None], texts[:args.docs or None]
+    queries = [(q, url) for q, url, _ in sample_queries(ids, texts, args.queries, seed=args.seed)]
+
+    # chunk once with the baseline's tokenizer; every backend shares it
+    model = embedding.load_model(args.model, "torch")
+    spans = [(url, text, chunker.chunk_spans(text, model.tokenizer)) for url, text in zip(ids, texts)]
+    del model
+    chunks = [text[s:e] for _, text, doc_spans in spans for s, e in doc_spans]
+    chunk_urls = [url for url, _, doc_spans in spans for _ in doc_spans]
+
+    results, baseline = [], None
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        result, vectors, query_vectors = run(backend, chunks, queries, args)
+        hits = top_docs(vectors, chunk_urls, query_vectors, args.k, args.k * 8)
+        result["retrieval"] = retrieval_scores([rank_of(url, h) for (_, url), h in zip(queries, hits)], (1, args.k))
+        if baseline is None:
+            baseline = (vectors, query_vectors, hits)
+        else:
+            cosine = np.sum(vectors * baseline[0], axis=1)
+            query_cosine = np.sum(query_vectors * baseline[1], axis=1)
+            result["drift"] = {
+                "chunk_cosine_mean": float(cosine.mean()), "chunk_cosine_min": float(cosine.min()),
+                "query_cosine_mean": float(query_cosine.mean()),
+                f"top{args.k}_overlap": float(np.mean([
+                    len(set(h) & set(b)) / max(1, len(b)) for h, b in zip(hits, baseline[2])
+                ])),
+            }
+        results.append(result)
+    return {
+        "model": args.model, "docs": len(ids), "chunks": len(chunks), "queries": len(queries),
+        "k": args.k, "results": results,
+    }
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--backends", nargs="+", default=list(embedding.BACKENDS), choices=embedding.BACKENDS)
+    p.add_argument("--model", default=embedding.EMBED_MODEL)
+    p.add_argument("--docs", type=int, default=0, help="only the first N docs (0: all)")
+    p.add_argument("--queries", type=int, default=300)
+    p.add_argument("--latency-queries", type=int, default=200)
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--k", type=int, default=5)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--data", default="data")
+    p.add_argument("--out", help="write the JSON here instead of stdout")
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    # model loading logs to stdout; keep it clean for the JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        result = main(args)
+    out = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
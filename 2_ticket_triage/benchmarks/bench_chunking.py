@@ -0,0 +1,92 @@
+"""
+Memory vs. retrieval quality across chunking settings on the bundled corpus.
+Every setting indexes the same docs in memory and answers the same synthetic
+queries: sentences sampled from the docs, each labelled with its source url.
+Recall is split by where the sentence sits. "head" is within the model's
+max_seq_length tokens of the doc start, which a whole-doc vector can see;
+"tail" is beyond it. Prints JSON.
+
+    python -m benchmarks.bench_chunking --settings none tokens:128:32 tokens:200:40 sentences:200:40
+"""
+import argparse
+import json
+import time
+
+from app import chunker, rag
+from app.indexer import load_documents, build_unsaved
+from benchmarks.common import sample_queries, rank_of, retrieval_scores, summary
+
+def parse_setting(spec):
+    """'none' | 'tokens:200:40' | 'sentences:200:40' -> (mode, size, overlap)"""
+    mode, *rest = spec.split(":")
+    size, overlap = (int(x) for x in rest) if rest else (0, 0)
+    return mode, size, overlap
+
+def evaluate(snapshot, queries, query_embeddings, k, fetch):
+    ranks, latencies = [], []
+    for (_, url, _), q in zip(queries, query_embeddings):
+        t0 = time.perf_counter()
+        D, I = snapshot.index.search(q.reshape(1, -1), fetch)
+        hits = rag.collapse(snapshot, D[0], I[0], k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        ranks.append(rank_of(url, [snapshot.ids[pos] for pos, _, _ in hits]))
+    return ranks, latencies
+
+def main(args):
+    ids, texts = load_documents(args.data)
+    docs = dict(zip(ids, texts))
+    tokenizer = rag.get_model().tokenizer
+    limit = rag.get_model().max_seq_length
+    queries = sample_queries(ids, texts, args.queries, seed=args.seed)
+    # is the answer within what a single whole-doc vector can see?
+    tail = [
+        len(tokenizer(docs[url][:offset], add_special_tokens=False, verbose=False)["input_ids"]) >= limit
+        for _, url, offset in queries
+    ]
+    query_embeddings = rag.embed_documents([q for q, _, _ in queries])
+
+    results = []
+    for spec in args.settings:
+        mode, size, overlap = parse_setting(spec)
+        chunk = lambda url, text: chunker.chunk_document(url, text, tokenizer, mode, size, overlap)
+        t0 = time.perf_counter()
+        snapshot = build_unsaved(docs, rag.embed_documents, chunk, rag.embedding_dim())
+        build_seconds = time.perf_counter() - t0
+        fetch = args.k if mode == "none" else args.k * rag.CHUNKS_PER_DOC
+        ranks, latencies = evaluate(snapshot, queries, query_embeddings, args.k, fetch)
+        vectors = snapshot.index.ntotal
+        results.append({
+            "setting": spec,
+            "vectors": vectors,
+            "vectors_per_doc": vectors / len(docs),
+            # flat float32 vectors plus id map, labels and spans
+            "index_mb": vectors * (rag.embedding_dim() * 4 + 8 + 24) / 2**20,
+            "build_seconds": build_seconds,
+            "all": retrieval_scores(ranks, (1, args.k)),
+            "head": retrieval_scores([r for r, t in zip(ranks, tail) if not t], (1, args.k)),
+            "tail": retrieval_scores([r for r, t in zip(ranks, tail) if t], (1, args.k)),
+            "search_ms": summary(latencies),
+        })
+    return {
+        "model": rag.EMBED_MODEL, "docs": len(docs), "queries": len(queries),
+        "tail_queries": sum(tail), "k": args.k, "results": results,
+    }
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--settings", nargs="+", default=["none", "tokens:128:32", "tokens:200:40", "sentences:200:40"])
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--k", type=int, default=5)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--data", default="data")
+    p.add_argument("--out", help="write the JSON here instead of stdout")
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    out = json.dumps(main(args), indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
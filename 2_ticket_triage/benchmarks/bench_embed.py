@@ -0,0 +1,92 @@
+"""
+Query embedding throughput and latency under concurrency: each of C client
+threads embeds sentences from the corpus back to back, either calling the model
+directly with a batch of one (how /respond used to embed) or through the
+MicroBatcher. Prints JSON with QPS, latency percentiles and the batch sizes the
+batcher actually formed.
+
+    python -m benchmarks.bench_embed --concurrency 1 4 16 64 --requests 2000
+    python -m benchmarks.bench_embed --max-wait-ms 0 1 5 --workers 2 --torch-threads 2
+"""
+import argparse
+import json
+import threading
+import time
+
+from app import rag
+from app.embedder import MicroBatcher
+from app.indexer import load_documents
+from benchmarks.common import sample_queries, summary
+
+def load(call, queries, concurrency, requests):
+    """Run `requests` calls of `call(query)` from `concurrency` threads; QPS and latencies."""
+    latencies = []
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            t0 = time.perf_counter()
+            call(queries[i % len(queries)])
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return requests / (time.perf_counter() - t0), latencies
+
+def main(args):
+    ids, texts = load_documents(args.data)
+    queries = [q for q, _, _ in sample_queries(ids, texts, 1000, seed=args.seed)]
+    rag.embed_documents(queries[:8])  # warm up
+
+    batches = []
+    def encode(texts):
+        batches.append(len(texts))
+        return rag.embed_documents(texts)
+
+    results = []
+    for concurrency in args.concurrency:
+        qps, latencies = load(lambda q: rag.embed_documents([q]), queries, concurrency, args.requests)
+        results.append({"mode": "direct", "concurrency": concurrency, "qps": qps, "latency_ms": summary(latencies)})
+        for max_wait in args.max_wait_ms:
+            batcher = MicroBatcher(encode, args.batch_size, max_wait, args.workers, args.torch_threads)
+            batches.clear()
+            qps, latencies = load(batcher.embed, queries, concurrency, args.requests)
+            results.append({
+                "mode": "batched", "concurrency": concurrency, "max_wait_ms": max_wait,
+                "qps": qps, "latency_ms": summary(latencies), "batch_size": summary(batches),
+            })
+    return {
+        "model": rag.EMBED_MODEL, "requests": args.requests, "batch_size": args.batch_size,
+        "workers": args.workers, "torch_threads": args.torch_threads, "results": results,
+    }
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 64])
+    p.add_argument("--requests", type=int, default=2000, help="queries per concurrency level and mode")
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--max-wait-ms", nargs="+", type=float, default=[2])
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--torch-threads", type=int, default=0)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--data", default="data")
+    p.add_argument("--out", help="write the JSON here instead of stdout")
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    out = json.dumps(main(args), indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
@@ -0,0 +1,205 @@
+"""
+Retrieval quality and load for the current configuration (model, backend,
+chunking, index type, hybrid and rerank settings), as JSON that can be compared
+between runs:
+
+- retrieval: the labelled queries in benchmarks/queries.jsonl (hand-written
+  questions and exact terms, each with the url(s) of the docs answering it)
+  against the saved index. Reports recall@k and MRR for vector-only, hybrid
+  (BM25 fused in) and, with --rerank, reranked retrieval, overall and per query
+  type. Latency distributions are reported separately for query embedding,
+  FAISS search, BM25, and fusion plus collapsing to documents.
+- load: --concurrency clients send /classify then /respond for labelled queries
+  to the FastAPI app for --duration seconds, through an in-process test client.
+  A throwaway SQLite database stands in for Postgres. Reports requests/s,
+  status codes and latency per endpoint. The query cache is off unless
+  --query-cache, since the labelled set is small enough to be cached after one
+  pass.
+
+    python -m benchmarks.bench_eval
+    python -m benchmarks.bench_eval --suites retrieval --rerank --out before.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# the load suite writes tickets; point the app at a scratch SQLite file instead of
+# the service's Postgres before app.config reads DATABASE_URL
+SCRATCH_DIR = tempfile.mkdtemp(prefix="triage-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH_DIR, 'triage.db')}"
+
+from app import ann, chunker, embedding, rag  # noqa: E402
+from app.bm25 import reciprocal_rank_fusion  # noqa: E402
+from app.config import (  # noqa: E402
+    EMBED_BACKEND, INDEX_TYPE, HYBRID_SEARCH, RERANK, RERANK_MODEL, RERANK_CANDIDATES, RERANK_BUDGET_MS,
+)
+from benchmarks.common import LABELS, load_labels, rank_of_any, retrieval_scores, summary  # noqa: E402
+
+def timed(fn, *args):
+    """(result, milliseconds)"""
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - t0) * 1000
+
+def scores_by_type(ranks, types, ks):
+    out = {"all": retrieval_scores(ranks, ks)}
+    for kind in sorted(set(types)):
+        out[kind] = retrieval_scores([r for r, t in zip(ranks, types) if t == kind], ks)
+    return out
+
+def evaluate_retrieval(labels, args):
+    snapshot = rag.current
+    ks = tuple(sorted(set(args.k)))
+    n = max(ks + ((RERANK_CANDIDATES,) if args.rerank else ()))
+    fetch = n * rag.CHUNKS_PER_DOC
+    urls = lambda hits: [snapshot.ids[pos] for pos, _, _ in hits]
+
+    for q, _, _ in labels[:5]:  # warm up
+        rag.embed_documents([q])
+    ranks, latencies = defaultdict(list), defaultdict(list)
+    for q, answers, _ in labels:
+        q_emb, ms = timed(rag.embed_documents, [q])
+        latencies["embed"].append(ms)
+        (D, I), ms = timed(ann.search, snapshot.index, q_emb, fetch)
+        latencies["search"].append(ms)
+        vector, ms = timed(rag.collapse, snapshot, D[0], I[0], n)
+        latencies["collapse"].append(ms)
+        ranks["vector"].append(rank_of_any(answers, urls(vector[:max(ks)])))
+        hybrid = None
+        if snapshot.lexical is not None:
+            lexical, ms = timed(rag.lexical_search, snapshot, q, fetch)
+            latencies["bm25"].append(ms)
+            t0 = time.perf_counter()
+            scores, chunk_labels = reciprocal_rank_fusion([I[0], lexical])
+            hybrid = rag.collapse(snapshot, scores, chunk_labels, n)
+            latencies["fuse_and_collapse"].append((time.perf_counter() - t0) * 1000)
+            ranks["hybrid"].append(rank_of_any(answers, urls(hybrid[:max(ks)])))
+        if args.rerank:
+            candidates = hybrid if HYBRID_SEARCH and hybrid is not None else vector
+            (top, _), ms = timed(rag.rerank_hits, q, candidates, max(ks), args.rerank_budget_ms)
+            latencies["rerank"].append(ms)
+            ranks["rerank"].append(rank_of_any(answers, urls(top)))
+
+    types = [kind for _, _, kind in labels]
+    return {
+        "queries": len(labels), "query_types": dict(Counter(types)), "ks": ks,
+        # what /respond uses with the current settings
+        "served": "rerank" if args.rerank else "hybrid" if HYBRID_SEARCH and snapshot.lexical is not None else "vector",
+        "modes": {mode: scores_by_type(r, types, ks) for mode, r in ranks.items()},
+        "latency_ms": {stage: summary(samples) for stage, samples in latencies.items()},
+    }
+
+def run_load(labels, args):
+    # imported here: app.main pulls in the database layer, which only the load suite needs
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    if not args.query_cache:
+        rag.query_cache.size = 0
+    latencies, statuses = defaultdict(list), defaultdict(Counter)
+    lock = threading.Lock()
+    counter = iter(range(1, 1 << 62))
+
+    def call(client, endpoint, body):
+        t0 = time.perf_counter()
+        status = client.post(endpoint, json=body).status_code
+        ms = (time.perf_counter() - t0) * 1000
+        with lock:
+            latencies[endpoint].append(ms)
+            statuses[endpoint][status] += 1
+
+    def client_loop(client, seed, deadline):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            query = rng.choice(labels)[0]
+            with lock:
+                ticket_id = f"bench-{seed}-{next(counter)}"
+            call(client, "/classify", {"id": ticket_id, "text": query})
+            body = {"ticket_id": ticket_id, "query": query}
+            if args.rerank:
+                body["rerank"] = True
+            call(client, "/respond", body)
+
+    with TestClient(app) as client:
+        if not rag.ready.wait(args.ready_timeout):
+            raise RuntimeError(f"index not ready after {args.ready_timeout}s: {rag.load_error}")
+        # warm up, then measure from a clean slate
+        client_loop(client, -1, time.perf_counter() + min(2.0, args.duration))
+        latencies.clear()
+        statuses.clear()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            deadline = t0 + args.duration
+            for f in [pool.submit(client_loop, client, i, deadline) for i in range(args.concurrency)]:
+                f.result()
+        elapsed = time.perf_counter() - t0
+    return {
+        "concurrency": args.concurrency, "seconds": elapsed, "query_cache": args.query_cache,
+        "endpoints": {
+            endpoint: {
+                "requests": len(samples), "requests_per_second": len(samples) / elapsed,
+                "status": {str(code): n for code, n in sorted(statuses[endpoint].items())},
+                "latency_ms": summary(samples),
+            }
+            for endpoint, samples in latencies.items()
+        },
+    }
+
+def main(args):
+    labels = load_labels(args.labels)
+    rag.ingest_documents_from_data(args.data)
+    if args.rerank:
+        # requests skip the rerank while the model is still loading
+        rag.reranker.get_model()
+    result = {
+        "config": {
+            "index": rag.index_name(), "model": embedding.EMBED_MODEL, "backend": EMBED_BACKEND,
+            "chunking": chunker.describe(), "index_type": INDEX_TYPE, "hybrid": HYBRID_SEARCH,
+            "rerank": RERANK_MODEL if args.rerank else None, "docs": len(rag.current),
+            "vectors": rag.current.index.ntotal, "labels": os.path.relpath(args.labels),
+        },
+    }
+    if "retrieval" in args.suites:
+        result["retrieval"] = evaluate_retrieval(labels, args)
+    if "load" in args.suites:
+        result["load"] = run_load(labels, args)
+    return result
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--suites", nargs="+", default=["retrieval", "load"], choices=["retrieval", "load"])
+    p.add_argument("--labels", default=LABELS, help="JSON lines of {query, urls, type}")
+    p.add_argument("--k", type=int, nargs="+", default=[1, 5, 10])
+    p.add_argument("--rerank", action="store_true", default=RERANK, help="also score (and serve) cross-encoder reranking")
+    p.add_argument("--rerank-budget-ms", type=float, default=RERANK_BUDGET_MS)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--duration", type=float, default=20, help="seconds of load")
+    p.add_argument("--query-cache", action="store_true", help="keep the query cache on during load")
+    p.add_argument("--ready-timeout", type=float, default=600)
+    p.add_argument("--data", default=os.getenv("DATA_DIR", "data"))
+    p.add_argument("--out", help="write the JSON here instead of stdout")
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        # model loading and the app log to stdout; keep it clean for the JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            result = main(args)
+    finally:
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+    out = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
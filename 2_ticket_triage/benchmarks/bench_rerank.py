@@ -0,0 +1,99 @@
+"""
+Added latency vs. ranking improvement of the cross-encoder rerank stage. Each
+query retrieves candidates from the saved index like /respond does (vectors,
+plus BM25 with HYBRID_SEARCH). The retrieval order is the baseline, and each
+--candidates / --budget-ms pair is then reranked and scored against the
+labels. Reports recall@1/@k and MRR, rerank time per query, and how often the
+budget cut the rerank short.
+
+Queries come from the labelled set in benchmarks/queries.jsonl (or --labels),
+or with --sampled N from sentences sampled from the docs. Sampled sentences
+are verbatim, so they flatter the first stage and understate what reranking
+adds on real questions. Prints JSON.
+
+    python -m benchmarks.bench_rerank --candidates 20 50 --budget-ms 25 50 100 inf
+"""
+import argparse
+import contextlib
+import json
+import sys
+import time
+
+from app import rag
+from app.config import HYBRID_SEARCH, RERANK_MODEL
+from benchmarks.common import LABELS, load_labels, sample_queries, rank_of_any, retrieval_scores, summary
+
+def urls(snapshot, hits):
+    return [snapshot.ids[pos] for pos, _, _ in hits]
+
+def main(args):
+    rag.ingest_documents_from_data(args.data)
+    snapshot = rag.current
+    if args.sampled:
+        queries = [(q, [url]) for q, url, _ in sample_queries(snapshot.ids, snapshot.texts, args.sampled, seed=args.seed)]
+    else:
+        queries = [(q, urls) for q, urls, _ in load_labels(args.labels)]
+
+    # first stage once per query, at the widest candidate count
+    widest = max(args.candidates)
+    q_embs = rag.embed_documents([q for q, _ in queries])
+    candidates, first_stage = [], []
+    for (q, _), q_emb in zip(queries, q_embs):
+        t0 = time.perf_counter()
+        lexical = rag.lexical_search(snapshot, q, widest * rag.CHUNKS_PER_DOC) if HYBRID_SEARCH else None
+        candidates.append(rag.search_documents(snapshot, q_emb, lexical, widest))
+        first_stage.append((time.perf_counter() - t0) * 1000)
+    baseline = [rank_of_any(labels, urls(snapshot, hits[:args.k])) for (_, labels), hits in zip(queries, candidates)]
+
+    # load the model and settle the per-pair cost estimate before timing
+    rag.reranker.get_model()
+    for (q, _), hits in zip(queries[:3], candidates):
+        rag.rerank_hits(q, hits[:rag.reranker.batch_size], args.k, float("inf"))
+
+    results = []
+    for n in args.candidates:
+        for budget in args.budget_ms:
+            ranks, latencies, complete = [], [], 0
+            for (q, labels), hits in zip(queries, candidates):
+                t0 = time.perf_counter()
+                top, full = rag.rerank_hits(q, hits[:n], args.k, budget)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                ranks.append(rank_of_any(labels, urls(snapshot, top)))
+                complete += full
+            results.append({
+                # null: unlimited
+                "candidates": n, "budget_ms": budget if budget != float("inf") else None,
+                "retrieval": retrieval_scores(ranks, (1, args.k)),
+                "rerank_ms": summary(latencies),
+                "fully_reranked": complete / len(queries),
+            })
+    return {
+        "model": RERANK_MODEL, "batch_size": rag.reranker.batch_size, "docs": len(snapshot),
+        "queries": len(queries), "labelled": not args.sampled, "hybrid": HYBRID_SEARCH, "k": args.k,
+        "baseline": {"retrieval": retrieval_scores(baseline, (1, args.k)), "first_stage_ms": summary(first_stage)},
+        "results": results,
+    }
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--candidates", type=int, nargs="+", default=[20, 50])
+    p.add_argument("--budget-ms", type=float, nargs="+", default=[25, 50, 100, 150, float("inf")])
+    p.add_argument("--labels", default=LABELS, help="JSON lines of {query, urls}")
+    p.add_argument("--sampled", type=int, default=0, help="use N sentences sampled from the docs instead")
+    p.add_argument("--k", type=int, default=5)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--data", default="data")
+    p.add_argument("--out", help="write the JSON here instead of stdout")
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    # model and index loading log to stdout; keep it clean for the JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        result = main(args)
+    out = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
@@ -0,0 +1,164 @@
+"""
+Startup cost and per-worker memory of the triage service, each measured in fresh
+processes:
+
+- stages: time and RSS after importing app.main, after loading the model and
+  after loading the (already saved) index, plus the slowest imports (-X importtime);
+- workers: N processes each loading the model and index and answering one query,
+  either independently (uvicorn --workers) or forked from a master that preloaded
+  them (gunicorn -c gunicorn.conf.py). RSS double-counts shared pages, so PSS
+  (shared pages split between sharers) and USS (private pages) are reported too.
+
+Prints JSON.
+
+    python -m benchmarks.bench_startup --workers 4
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+QUERY = "How do I configure SSO for the admin console?"
+
+def memory(pid="self"):
+    """RSS, PSS and USS of a process in MB."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": fields.get("Rss", 0), "pss_mb": fields.get("Pss", 0),
+        "uss_mb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+def child(stage, data_dir, workers):
+    """Runs inside a measured subprocess; reports one JSON line on stdout."""
+    # the service logs with print; keep stdout for the report
+    out, sys.stdout = sys.stdout, sys.stderr
+    t0 = time.perf_counter()
+    import app.main  # noqa: F401
+    from app import rag
+    report = {"import_seconds": time.perf_counter() - t0, "after_import": memory()}
+    if stage == "stages":
+        t1 = time.perf_counter()
+        rag.get_model()
+        report["model_seconds"] = time.perf_counter() - t1
+        report["after_model"] = memory()
+        t1 = time.perf_counter()
+        rag.ingest_documents_from_data(data_dir)
+        report["index_seconds"] = time.perf_counter() - t1
+        report["after_index"] = memory()
+        print(json.dumps(report), file=out, flush=True)
+        return
+    if stage == "independent":
+        rag.ingest_documents_from_data(data_dir)
+        rag.generate_response(QUERY)
+        print(json.dumps({"pids": [os.getpid()]}), file=out, flush=True)
+        sys.stdin.readline()
+        return
+    # preload: load like gunicorn's master, then fork the workers
+    rag.preload(data_dir)
+    read_end, write_end = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            rag.start_loading(data_dir)
+            rag.ready.wait()
+            rag.generate_response(QUERY)
+            os.write(write_end, b".")
+            signal.pause()
+            os._exit(0)
+        pids.append(pid)
+    os.close(write_end)
+    for _ in pids:
+        os.read(read_end, 1)
+    print(json.dumps({"pids": [os.getpid()] + pids, "master": os.getpid()}), file=out, flush=True)
+    sys.stdin.readline()
+    for pid in pids:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+
+def spawn(stage, args, extra=(), stderr=subprocess.DEVNULL):
+    return subprocess.Popen(
+        [sys.executable, *extra, "-m", "benchmarks.bench_startup", "--child", stage, "--data", args.data,
+         "--workers", str(args.workers)],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr, text=True,
+    )
+
+def slowest_imports(stderr, n):
+    """
+    Top `n` top-level packages by cumulative import time, from -X importtime
+    output. A package imported by another one is counted in both.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            name = name.strip()
+            if cumulative.strip().isdigit() and "." not in name and name != "app":
+                rows.append((int(cumulative) / 1e6, name))
+    return [{"module": name, "seconds": s} for s, name in sorted(rows, reverse=True)[:n]]
+
+def worker_memory(stage, args):
+    t0 = time.perf_counter()
+    procs = [spawn(stage, args) for _ in range(1 if stage == "preload" else args.workers)]
+    reports = [json.loads(p.stdout.readline()) for p in procs]
+    ready_seconds = time.perf_counter() - t0
+    pids = [pid for r in reports for pid in r["pids"]]
+    per_process = {pid: memory(pid) for pid in pids}
+    for p in procs:
+        p.stdin.close()
+        p.wait()
+    masters = {r.get("master") for r in reports}
+    workers = [m for pid, m in per_process.items() if pid not in masters]
+    return {
+        "mode": stage, "workers": len(workers), "seconds_until_all_ready": ready_seconds,
+        "worker_rss_mb": sum(w["rss_mb"] for w in workers) / len(workers),
+        "worker_uss_mb": sum(w["uss_mb"] for w in workers) / len(workers),
+        # what the whole group really occupies, master included
+        "total_pss_mb": sum(m["pss_mb"] for m in per_process.values()),
+    }
+
+def main(args):
+    # make sure the index is saved so every run measures loading, not building
+    warm = spawn("stages", args)
+    warm.communicate()
+
+    p = spawn("stages", args, ["-X", "importtime"], stderr=subprocess.PIPE)
+    t0 = time.perf_counter()
+    out, err = p.communicate()
+    stages = json.loads(out.splitlines()[-1])
+    stages["process_seconds"] = time.perf_counter() - t0
+    stages["slowest_imports"] = slowest_imports(err, args.top_imports)
+    return {
+        "stages": stages,
+        "workers": [worker_memory(mode, args) for mode in ("independent", "preload")],
+    }
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--top-imports", type=int, default=10)
+    p.add_argument("--data", default=os.getenv("DATA_DIR", "data"))
+    p.add_argument("--child", help=argparse.SUPPRESS)
+    p.add_argument("--out", help="write the JSON here instead of stdout")
+    return p.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        child(args.child, args.data, args.workers)
+        sys.exit(0)
+    out = json.dumps(main(args), indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
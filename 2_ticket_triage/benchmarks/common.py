@@ -0,0 +1,85 @@
+import json
+import os
+import random
+import re
+import statistics
+
+# hand-written questions and exact terms, each labelled with the url(s) of the docs
+# in data/ that answer it
+LABELS = os.path.join(os.path.dirname(__file__), "queries.jsonl")
+
+# a "sentence" for query sampling: runs of text between sentence ends / line breaks
+SENTENCE = re.compile(r"[^.!?\n]+[.!?]?")
+
+def sample_queries(ids, texts, n, seed=0, min_words=6, max_words=25):
+    """
+    `n` synthetic (query, url, char offset) triples: a random sentence of a random
+    document, used verbatim as the query. Offsets show how far into its document
+    the answer sits, which is what chunking is meant to reach.
+    """
+    rng = random.Random(seed)
+    eligible = []
+    for url, text in zip(ids, texts):
+        sentences = [
+            m for m in SENTENCE.finditer(text) if min_words <= len(m.group().split()) <= max_words
+        ]
+        if sentences:
+            eligible.append((url, sentences))
+    if not eligible:
+        return []
+    rng.shuffle(eligible)
+    queries = []
+    # one query per document before any document is used twice
+    for i in range(n):
+        url, sentences = eligible[i % len(eligible)]
+        m = rng.choice(sentences)
+        queries.append((m.group().strip(), url, m.start()))
+    return queries
+
+def same_doc(a, b):
+    # the crawl has some pages under both ".../page" and ".../page/"
+    return a.rstrip("/") == b.rstrip("/")
+
+def rank_of(url, hits):
+    """1-based rank of `url` among hit urls, or None."""
+    for rank, hit in enumerate(hits, 1):
+        if same_doc(url, hit):
+            return rank
+    return None
+
+def load_labels(path=LABELS):
+    """[(query, [urls], type)] from JSON lines of {"query", "urls" (or "url"), "type"}."""
+    labels = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                labels.append((row["query"], row.get("urls") or [row["url"]], row.get("type", "question")))
+    return labels
+
+def rank_of_any(urls, hits):
+    """Best 1-based rank of any of `urls` among hit urls, or None."""
+    ranks = [r for r in (rank_of(url, hits) for url in urls) if r is not None]
+    return min(ranks, default=None)
+
+def retrieval_scores(ranks, ks=(1, 5, 10)):
+    """recall@k for each k and MRR from a list of ranks (None = not found)."""
+    n = len(ranks) or 1
+    scores = {f"recall@{k}": sum(1 for r in ranks if r is not None and r <= k) / n for k in ks}
+    scores["mrr"] = sum(1 / r for r in ranks if r is not None) / n
+    return scores
+
+def summary(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {
+        "count": len(samples), "mean": statistics.fmean(samples),
+        "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": samples[-1],
+    }
+
+def rss_mb():
+    """Current resident set size of this process."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096 / 2**20
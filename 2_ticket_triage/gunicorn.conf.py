@@ -0,0 +1,27 @@
+# gunicorn.conf.py: several uvicorn workers sharing one preloaded model
+#   gunicorn -c gunicorn.conf.py app.main:app
+import os
+import shutil
+
+# metrics from all workers: each writes its own files here and /metrics merges
+# them. Set before the app (and prometheus_client) is imported, and emptied so a
+# restart doesn't count the previous run's workers.
+multiproc_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/triage-prometheus")
+shutil.rmtree(multiproc_dir, ignore_errors=True)
+os.makedirs(multiproc_dir)
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+# import the app in the master, before forking workers
+preload_app = True
+
+def on_starting(server):
+    # the model (and the saved index, if current) are loaded once here; forked
+    # workers inherit them copy-on-write and skip loading in their startup
+    from app import rag
+    rag.preload()
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)